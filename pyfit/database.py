@@ -0,0 +1,97 @@
+"""
+DATABASES, DATABASE_ROUTERS and CACHES built from environment variables.
+
+Without PYFIT_DB_NAME the project keeps using the local SQLite file. With it, settings point at
+Postgres:
+
+    PYFIT_DB_NAME, PYFIT_DB_USER, PYFIT_DB_PASSWORD, PYFIT_DB_HOST, PYFIT_DB_PORT
+    PYFIT_DB_CONN_MAX_AGE       Seconds to keep a connection open between requests (default 60, 0 closes every request)
+    PYFIT_DB_STATEMENT_TIMEOUT  Milliseconds before Postgres cancels a statement (default 0, no limit)
+    PYFIT_DB_POOL               'true' to use the pyfit.pooled_postgresql engine (an in-process psycopg2 pool)
+    PYFIT_DB_POOL_MIN / PYFIT_DB_POOL_MAX   Pool size (defaults 1 / 10)
+    PYFIT_DB_POOL_CHECK_AFTER   Seconds a pooled connection may sit idle before it's pinged on checkout (default 30)
+    PYFIT_DB_REPLICA_HOSTS      Comma separated read replica hosts, added as replica_1, replica_2, ...
+
+PYFIT_DB_SQLITE_REPLICA=true adds replica_1 as a second connection to the same SQLite file, and a
+test mirror of default, so replica routing can be exercised locally with every read seeing current
+data, e.g. `PYFIT_DB_SQLITE_REPLICA=true python manage.py test`.
+
+The weekly plan cache and the replica stickiness flag must be shared by every process serving
+requests, otherwise a write in one worker leaves stale plans and replica reads in the others. The
+per-process local memory cache is only used for SQLite; with Postgres the default cache is the
+pyfit_cache table on default, created once with `python manage.py createcachetable`.
+
+    PYFIT_CACHE_BACKEND         Dotted path of a cache backend to use instead, e.g. memcached
+    PYFIT_CACHE_LOCATION        Its LOCATION (table name, directory or host:port)
+"""
+import os
+
+
+def env_bool(environ, name, default=False):
+    return environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def postgres_settings(environ, host):
+    statement_timeout = int(environ.get('PYFIT_DB_STATEMENT_TIMEOUT', 0))
+    pooled = env_bool(environ, 'PYFIT_DB_POOL')
+    database = {
+        'ENGINE': 'pyfit.pooled_postgresql' if pooled else 'django.db.backends.postgresql',
+        'NAME': environ['PYFIT_DB_NAME'],
+        'USER': environ.get('PYFIT_DB_USER', ''),
+        'PASSWORD': environ.get('PYFIT_DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': environ.get('PYFIT_DB_PORT', ''),
+        'CONN_MAX_AGE': int(environ.get('PYFIT_DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {},
+    }
+    if statement_timeout:
+        database['OPTIONS']['options'] = '-c statement_timeout={}'.format(statement_timeout)
+    if pooled:
+        database['POOL'] = {
+            'MIN': int(environ.get('PYFIT_DB_POOL_MIN', 1)),
+            'MAX': int(environ.get('PYFIT_DB_POOL_MAX', 10)),
+            'CHECK_AFTER': float(environ.get('PYFIT_DB_POOL_CHECK_AFTER', 30)),
+        }
+    return database
+
+
+def databases_from_env(base_dir, environ=os.environ):
+    """
+    :return tuple: (DATABASES, DATABASE_ROUTERS)
+    """
+    if not environ.get('PYFIT_DB_NAME'):
+        databases = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(base_dir, 'db.sqlite3'),
+            }
+        }
+        if not env_bool(environ, 'PYFIT_DB_SQLITE_REPLICA'):
+            return databases, []
+        databases['replica_1'] = dict(databases['default'], TEST={'MIRROR': 'default'})
+        return databases, ['pyfit.routers.PrimaryReplicaRouter']
+
+    databases = {'default': postgres_settings(environ, environ.get('PYFIT_DB_HOST', ''))}
+    replica_hosts = [x.strip() for x in environ.get('PYFIT_DB_REPLICA_HOSTS', '').split(',') if x.strip()]
+    for index, host in enumerate(replica_hosts, start=1):
+        replica = postgres_settings(environ, host)
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases['replica_{}'.format(index)] = replica
+    routers = ['pyfit.routers.PrimaryReplicaRouter'] if replica_hosts else []
+    return databases, routers
+
+
+def caches_from_env(environ=os.environ):
+    """
+    :return dict: CACHES
+    """
+    if environ.get('PYFIT_CACHE_BACKEND'):
+        backend = environ['PYFIT_CACHE_BACKEND']
+        location = environ.get('PYFIT_CACHE_LOCATION', '')
+    elif environ.get('PYFIT_DB_NAME'):
+        backend = 'django.core.cache.backends.db.DatabaseCache'
+        location = environ.get('PYFIT_CACHE_LOCATION', 'pyfit_cache')
+    else:
+        backend = 'django.core.cache.backends.locmem.LocMemCache'
+        location = ''
+    return {'default': {'BACKEND': backend, 'LOCATION': location}}
@@ -0,0 +1,85 @@
+"""
+Postgres backend that borrows connections from an in-process psycopg2 pool.
+
+Closing a connection returns it to the pool instead of disconnecting. A connection that
+has sat idle longer than POOL['CHECK_AFTER'] seconds is pinged before it's handed out,
+and dropped if the ping fails. Configure with a POOL dict next to the usual settings:
+
+    'ENGINE': 'pyfit.pooled_postgresql',
+    'POOL': {'MIN': 1, 'MAX': 10, 'CHECK_AFTER': 30},
+"""
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool as psycopg2_pool
+from django.db.backends.postgresql import base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    returned_at = 0.0  # When the connection last went back into the pool
+
+
+def get_pool(alias, options, conn_params):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = psycopg2_pool.ThreadedConnectionPool(
+                options.get('MIN', 1), options.get('MAX', 10), **conn_params)
+        return _pools[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_pool_options(self):
+        return self.settings_dict.get('POOL', {})
+
+    def get_new_connection(self, conn_params):
+        options = self.get_pool_options()
+        conn_params['connection_factory'] = PooledConnection
+        pool = get_pool(self.alias, options, conn_params)
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
+        check_after = options.get('CHECK_AFTER', 30)
+        for _ in range(options.get('MAX', 10) + 1):
+            connection = pool.getconn()
+            if connection.closed:
+                pool.putconn(connection, close=True)
+                continue
+            idle = time.time() - connection.returned_at if connection.returned_at else 0
+            if idle > check_after and not self.ping(connection):
+                pool.putconn(connection, close=True)
+                continue
+            if isolation_level is not None:
+                self.isolation_level = isolation_level
+                connection.set_session(isolation_level=isolation_level)
+            return connection
+        raise psycopg2.OperationalError('No healthy connection available in the pool')
+
+    @staticmethod
+    def ping(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = _pools.get(self.alias)
+        if pool is None:
+            return super(DatabaseWrapper, self)._close()
+        with self.wrap_database_errors:
+            broken = bool(self.connection.closed)
+            if not broken:
+                try:
+                    self.connection.rollback()  # Hand it back without an open transaction
+                except psycopg2.Error:
+                    broken = True
+            self.connection.returned_at = time.time()
+            pool.putconn(self.connection, close=broken)
@@ -0,0 +1,88 @@
+"""
+Primary/replica routing.
+
+Reads go to a replica_N database only while ReplicaRoutingMiddleware is serving a GET to one of
+the read-only views in WORKOUT_REPLICA_VIEWS. Everything else, including every write, uses default.
+After a user writes, their reads stay on default for WORKOUT_REPLICA_STICKY_SECONDS, so they
+always see their own changes even while the replicas catch up.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+DEFAULT_REPLICA_VIEWS = (
+    'routine_list',
+    'routine_detail',
+    'exercise_history_list',
+    'exercise_history_detail',
+    'exercise_analytics',
+    'export_history',
+)
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [x for x in settings.DATABASES if x.startswith('replica_')]
+
+
+def replicas_enabled():
+    return getattr(settings, 'WORKOUT_READ_REPLICAS', True) and bool(replica_aliases())
+
+
+def sticky_cache_key(user_id):
+    return 'workout:primary-until-write:{}'.format(user_id)
+
+
+class PrimaryReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replica', False):
+            return random.choice(replica_aliases())
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        _state.use_replica = False  # Read back from where we just wrote for the rest of the request
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Every alias holds the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    """Decides per request whether the router may read from a replica, and records writes for stickiness"""
+    def __init__(self, get_response):
+        if not replicas_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.views = set(getattr(settings, 'WORKOUT_REPLICA_VIEWS', DEFAULT_REPLICA_VIEWS))
+        self.sticky_seconds = getattr(settings, 'WORKOUT_REPLICA_STICKY_SECONDS', 10)
+
+    def __call__(self, request):
+        _state.use_replica = False
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if _state.wrote and user is not None and user.is_authenticated():
+                cache.set(sticky_cache_key(user.id), True, self.sticky_seconds)
+            return response
+        finally:
+            _state.use_replica = False
+            _state.wrote = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if request.method not in ('GET', 'HEAD') or match is None or match.url_name not in self.views:
+            return None
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated() and cache.get(sticky_cache_key(user.id)):
+            return None
+        _state.use_replica = True
+        return None
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 
 import os
 
+from .database import caches_from_env, databases_from_env
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -40,8 +42,18 @@ INSTALLED_APPS = [
     'workout',
     'django_extensions',
     'django_nose',
+    'rest_framework',
 ]
 
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.SessionAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+}
+
 # TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 #
 # NOSE_ARGS = [
@@ -57,8 +69,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'workout.profiling.ProfilingMiddleware',  # Removes itself unless WORKOUT_PROFILING(_HEADER) is on
+    'pyfit.routers.ReplicaRoutingMiddleware',  # Removes itself unless there are replica databases
 ]
 
+WORKOUT_PROFILING = False
+WORKOUT_PROFILING_HEADER = False
+WORKOUT_PROFILING_MEMORY = False  # Trace allocations with tracemalloc for the whole process while profiling
+
+# Run background jobs inline instead of queueing them for `manage.py run_workers`
+WORKOUT_JOBS_EAGER = False
+
+# History rows deleted per transaction when purging a deleted routine, see workout/purge.py
+WORKOUT_PURGE_BATCH_SIZE = 5000
+
 ROOT_URLCONF = 'pyfit.urls'
 
 TEMPLATES = [
@@ -84,12 +108,17 @@ WSGI_APPLICATION = 'pyfit.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
-}
+# SQLite by default, Postgres with optional pooling and read replicas when PYFIT_DB_* is set.
+# See pyfit/database.py for the variables.
+DATABASES, DATABASE_ROUTERS = databases_from_env(BASE_DIR)
+TEST_RUNNER = 'pyfit.test_runner.MirrorSharingRunner'  # Replica test mirrors read inside each test's transaction
+
+# Serve read-only views from replica_N databases when there are any, see pyfit/routers.py
+WORKOUT_READ_REPLICAS = True
+WORKOUT_REPLICA_STICKY_SECONDS = 10
+
+# Shared by every worker: holds the weekly plan cache and the replica stickiness flag, see pyfit/database.py
+CACHES = caches_from_env()
 
 
 # Password validation
@@ -0,0 +1,20 @@
+"""
+Test runner that makes test mirrors share their primary's connection.
+
+Django points a mirror alias at its primary's test database, but through a connection of its own.
+TestCase only wraps each test in a transaction on the primary connection, so reads routed to a
+mirror would not see the test's rows (and SQLite reports the tables as locked). Sharing the
+connection object keeps routed reads inside the test's transaction.
+"""
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class MirrorSharingRunner(DiscoverRunner):
+    def setup_databases(self, **kwargs):
+        old_config = super(MirrorSharingRunner, self).setup_databases(**kwargs)
+        for alias in connections:
+            mirror = connections[alias].settings_dict.get('TEST', {}).get('MIRROR')
+            if mirror:
+                connections[alias] = connections[mirror]
+        return old_config
@@ -0,0 +1,138 @@
+"""
+Progression analytics computed over an exercise's whole history as NumPy arrays.
+
+History is loaded column-wise with values_list instead of as model instances, reading sets and
+weights_per_set straight from their packed columns. They are scattered into (sessions x MAX_SETS)
+matrices without a per-row Python loop, so every statistic is a handful of array operations no
+matter how many years of history there are.
+"""
+import itertools
+
+import numpy as np
+
+from .fields import raw
+
+MAX_SETS = 10  # size of the sets/weights_per_set array fields
+ONE_REP_MAX_FORMULAS = ('epley', 'brzycki')
+
+
+def load_history(exercise):
+    """
+    Load an exercise's history as columnar arrays ordered by timestamp
+
+    :param Exercise exercise:
+    :return tuple: (ids, timestamps, reps, weights) where reps and weights are (sessions x MAX_SETS) int arrays
+    """
+    rows = list(exercise.history.order_by('timestamp', 'id').annotate(
+        raw_sets=raw('sets'), raw_weights=raw('weights_per_set'),
+    ).values_list('id', 'timestamp', 'raw_sets', 'raw_weights'))
+    ids, timestamps, sets, weights_per_set = zip(*rows) if rows else ((), (), (), ())
+    sets, set_lengths = flatten(sets)
+    weights_per_set, weight_lengths = flatten(weights_per_set)
+    widths = np.minimum(np.minimum(set_lengths, weight_lengths), MAX_SETS)  # Sets with both reps and a weight
+    reps = pad(sets, set_lengths, widths)
+    weights = pad(weights_per_set, weight_lengths, widths)
+    return np.array(ids, dtype=np.int64), list(timestamps), reps, weights
+
+
+def flatten(column):
+    """
+    Every array of a sets or weights_per_set column end to end, without a loop over the rows in Python
+
+    :param tuple column: Packed bytes as selected with fields.raw, or lists from Postgres' integer[]
+    :return tuple: (values, lengths) int64 arrays
+    """
+    if column and isinstance(column[0], (bytes, bytearray, memoryview)):
+        values = np.frombuffer(b''.join(column), dtype='<i4').astype(np.int64)
+        lengths = np.fromiter(map(len, column), dtype=np.int64, count=len(column)) // 4
+    else:
+        lengths = np.fromiter(map(len, column), dtype=np.int64, count=len(column))
+        values = np.fromiter(itertools.chain.from_iterable(column), dtype=np.int64, count=int(lengths.sum()))
+    return values, lengths
+
+
+def pad(values, lengths, widths):
+    """Scatter flattened arrays into a (rows x MAX_SETS) matrix, keeping the first `widths` values of each row"""
+    matrix = np.zeros((len(lengths), MAX_SETS), dtype=np.int64)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keep = columns < widths[rows]
+    matrix[rows[keep], columns[keep]] = values[keep]
+    return matrix
+
+
+def estimated_one_rep_max(reps, weights, formula='epley'):
+    """
+    Estimated one rep max of every set. Sets without reps or weight estimate to 0.
+
+    :param numpy.ndarray reps:
+    :param numpy.ndarray weights:
+    :param str formula: 'epley' or 'brzycki'
+    :return numpy.ndarray: float array the same shape as reps
+    """
+    reps = reps.astype(np.float64)
+    weights = weights.astype(np.float64)
+    if formula == 'epley':
+        estimate = np.where(reps == 1, weights, weights * (1 + reps / 30.0))
+    elif formula == 'brzycki':
+        # Brzycki breaks down at 37+ reps, clamp the denominator so it stays positive
+        estimate = weights * 36.0 / np.maximum(37.0 - reps, 1.0)
+    else:
+        raise ValueError('Unknown one rep max formula: {}'.format(formula))
+    return np.where((reps > 0) & (weights > 0), estimate, 0.0)
+
+
+def best_one_rep_max(reps, weights, formula='epley'):
+    """Highest estimated one rep max of any set, or None when no set has both reps and weight"""
+    if not reps.size:
+        return None
+    return float(estimated_one_rep_max(reps, weights, formula).max()) or None
+
+
+def session_one_rep_max(sets, weights_per_set, formula='epley'):
+    """best_one_rep_max of a single session's sets and weights_per_set lists"""
+    width = min(len(sets), len(weights_per_set))
+    return best_one_rep_max(np.array([sets[:width]], dtype=np.int64),
+                            np.array([weights_per_set[:width]], dtype=np.int64), formula)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` sessions, shorter at the start of the history"""
+    if not len(values):
+        return values.astype(np.float64)
+    cumulative = np.cumsum(np.insert(values.astype(np.float64), 0, 0.0))
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    ends = np.arange(1, len(values) + 1)
+    return (cumulative[ends] - cumulative[ends - counts]) / counts
+
+
+def personal_records(values):
+    """Flag every session whose value beats everything before it"""
+    if not len(values):
+        return np.zeros(0, dtype=bool)
+    previous_best = np.maximum.accumulate(np.insert(values[:-1], 0, 0))
+    return values > previous_best
+
+
+def progression(exercise, formula='epley', window=5):
+    """
+    Per session progression statistics for an exercise
+
+    :param Exercise exercise:
+    :param str formula: One rep max formula, see ONE_REP_MAX_FORMULAS
+    :param int window: Number of sessions in the rolling averages
+    :return dict: Parallel lists keyed by statistic, ready for JsonResponse
+    """
+    ids, timestamps, reps, weights = load_history(exercise)
+    one_rep_max = estimated_one_rep_max(reps, weights, formula).max(axis=1) if len(ids) else np.zeros(0)
+    tonnage = (reps * weights).sum(axis=1)
+    return {
+        'id': ids.tolist(),
+        'timestamp': [x.isoformat() for x in timestamps],
+        'estimated_one_rep_max': np.round(one_rep_max, 2).tolist(),
+        'tonnage': tonnage.tolist(),
+        'rolling_one_rep_max': np.round(rolling_mean(one_rep_max, window), 2).tolist(),
+        'rolling_tonnage': np.round(rolling_mean(tonnage, window), 2).tolist(),
+        'one_rep_max_pr': personal_records(one_rep_max).tolist(),
+        'tonnage_pr': personal_records(tonnage).tolist(),
+    }
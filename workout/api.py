@@ -0,0 +1,111 @@
+"""
+Versioned, read-only REST API for routines, exercises and history, mounted at /api/v1/.
+
+Querysets are .values() projections of just the columns a client asks for with
+?fields=a,b,c. Every GET response carries an ETag, so a client that re-sends it in
+If-None-Match gets an empty 304 when nothing changed.
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import permissions, routers, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import date_windows
+from .models import Routine, Exercise, ExerciseHistory
+from .pagination import InvalidCursor, get_page_size, paginate_by_keyset
+from .serializers import RoutineSerializer, ExerciseSerializer, ExerciseHistorySerializer
+
+
+class ETagMixin(object):
+    """Adds a content-hash ETag to successful GETs and answers matching If-None-Match with 304"""
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ETagMixin, self).finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        response.render()
+        etag = '"{}"'.format(hashlib.md5(response.content).hexdigest())
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '').strip()
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if if_none_match == '*' or etag in etags or etag.strip('"') in etags:
+                response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+
+class ValuesViewSet(ETagMixin, viewsets.ReadOnlyModelViewSet):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @property
+    def requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        return set(x.strip() for x in fields.split(',')) if fields else None
+
+    def get_values_fields(self):
+        return self.get_serializer_class().get_values_fields(self.requested_fields)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = self.requested_fields
+        return super(ValuesViewSet, self).get_serializer(*args, **kwargs)
+
+
+class RoutineViewSet(ValuesViewSet):
+    serializer_class = RoutineSerializer
+
+    def get_queryset(self):
+        return Routine.objects.filter(
+            user__user_id=self.request.user.id
+        ).ordered_by_day().values(*self.get_values_fields())
+
+
+class ExerciseViewSet(ValuesViewSet):
+    """Filter with ?routine=<id>"""
+    serializer_class = ExerciseSerializer
+
+    def get_queryset(self):
+        queryset = Exercise.objects.filter(routine__user__user_id=self.request.user.id)
+        if self.request.query_params.get('routine', '').isdigit():
+            queryset = queryset.filter(routine_id=self.request.query_params['routine'])
+        return queryset.order_by('routine_id', 'priority', 'id').values(*self.get_values_fields())
+
+
+class ExerciseHistoryViewSet(ValuesViewSet):
+    """
+    Filter with ?exercise=<id>&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD.
+    Lists are keyset paginated; pass the previous page's `next` as ?cursor= and size pages with ?page_size=.
+    """
+    serializer_class = ExerciseHistorySerializer
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = ExerciseHistory.objects.filter(exercise__routine__user__user_id=self.request.user.id)
+        if params.get('exercise', '').isdigit():
+            queryset = queryset.filter(exercise_id=params['exercise'])
+        if params.get('start_date') or params.get('end_date'):
+            start, end = date_windows.date_range_window(
+                date_windows.parse_day(params.get('start_date')),
+                date_windows.parse_day(params.get('end_date')),
+            )
+            queryset = queryset.filter(timestamp__gte=start, timestamp__lt=end)
+        return queryset.values(*self.get_values_fields())
+
+    def list(self, request, *args, **kwargs):
+        try:
+            rows, next_cursor = paginate_by_keyset(
+                self.get_queryset(), request.query_params.get('cursor'),
+                get_page_size(request.query_params.get('page_size')))
+        except InvalidCursor:
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'next': next_cursor,
+        })
+
+
+router = routers.DefaultRouter()
+router.register(r'routines', RoutineViewSet, base_name='api-routine')
+router.register(r'exercises', ExerciseViewSet, base_name='api-exercise')
+router.register(r'history', ExerciseHistoryViewSet, base_name='api-history')
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WorkoutConfig(AppConfig):
     name = 'workout'
+
+    def ready(self):
+        from . import plan_cache, sync, tasks  # noqa: Connects signal handlers and registers the background tasks
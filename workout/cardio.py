@@ -0,0 +1,100 @@
+"""
+Packed per-second samples for CARDIO sessions.
+
+Each series of a CardioSession is stored as one little-endian typed array rather than as a row per
+sample, so an hour-long run is three ~14KB values. Series are decoded with np.frombuffer, which
+views the stored bytes without copying, and charts get them downsampled server side with
+Largest-Triangle-Three-Buckets so a few hundred points stand in for thousands.
+"""
+import numpy as np
+
+SERIES = {
+    'heart_rate': np.dtype('<u2'),  # Beats per minute, 0 where the sensor dropped out
+    'pace': np.dtype('<f4'),  # Seconds per kilometer, NaN where unknown
+    'distance': np.dtype('<f4'),  # Cumulative meters, NaN where unknown
+}
+MAX_SAMPLES = 24 * 60 * 60  # A day of samples at one per second
+DEFAULT_POINTS = 300
+
+
+def pack(name, values):
+    """
+    Pack a list of samples as the series' typed array
+
+    :param str name: One of SERIES
+    :param list values: Numbers, with None for missing samples
+    :return bytes:
+    :raises ValueError: When a sample isn't a number or None
+    """
+    dtype = SERIES[name]
+    missing = 0 if dtype.kind == 'u' else np.nan
+    array = np.array([missing if x is None else x for x in values], dtype=np.float64)
+    if array.ndim != 1:
+        raise ValueError('Samples must be numbers or None')
+    if dtype.kind == 'u':
+        array = np.clip(np.nan_to_num(array), 0, np.iinfo(dtype).max).round()
+    return array.astype(dtype).tobytes()
+
+
+def unpack(name, data):
+    """Read-only view of a packed series, without copying it"""
+    if not data:
+        return np.zeros(0, dtype=SERIES[name])
+    return np.frombuffer(data, dtype=SERIES[name])
+
+
+def present(name, values):
+    """Boolean mask of the samples that were actually recorded"""
+    if SERIES[name].kind == 'u':
+        return values > 0
+    return np.isfinite(values)
+
+
+def lttb(x, y, points):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps when reducing x, y to `points` points.
+    The first and last points are always kept, and from each bucket between them the point forming
+    the largest triangle with the previously kept point and the average of the next bucket.
+
+    :param numpy.ndarray x: Ascending
+    :param numpy.ndarray y:
+    :param int points:
+    :return numpy.ndarray: int indices into x and y
+    """
+    count = len(x)
+    points = max(points, 3)
+    if points >= count:
+        return np.arange(count)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)  # points - 2 buckets between the end points
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample(name, data, interval, points=DEFAULT_POINTS):
+    """
+    Downsample a packed series for charting
+
+    :param str name: One of SERIES
+    :param bytes data: The packed series
+    :param float interval: Seconds between samples
+    :param int points: Maximum points to return
+    :return list: [[seconds since the start, value], ...] for recorded samples only
+    """
+    values = unpack(name, data)
+    offsets = np.flatnonzero(present(name, values))
+    values = values[offsets].astype(np.float64)
+    seconds = offsets * float(interval)
+    kept = lttb(seconds, values, points)
+    return [[float(t), float(v)] for t, v in zip(seconds[kept], values[kept])]
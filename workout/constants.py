@@ -8,6 +8,8 @@ DAYS_OF_WEEK = (
     ('SATURDAY', 'Saturday'),
 )
 
+DAY_ORDINALS = {day: index for index, (day, _) in enumerate(DAYS_OF_WEEK)}
+
 USER_TYPES = (
     ('BASIC', 'Basic'),
     ('ADMIN', 'Administrator'),
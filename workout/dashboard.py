@@ -0,0 +1,100 @@
+"""
+Data for the dashboard, computed from a few aggregate queries over the ExerciseDailyVolume rollup
+so the cost grows with the days trained, not the sets logged. Cached per user for a short TTL.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from . import date_windows
+from .models import ExerciseDailyVolume, Routine
+
+DASHBOARD_CACHE_SECONDS = getattr(settings, 'WORKOUT_DASHBOARD_CACHE_SECONDS', 60)
+RECENT_PR_DAYS = 30
+
+
+def dashboard_cache_key(user_id):
+    return 'workout:dashboard:{}'.format(user_id)
+
+
+def get_dashboard(user_id):
+    key = dashboard_cache_key(user_id)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(user_id)
+        cache.set(key, data, DASHBOARD_CACHE_SECONDS)
+    return data
+
+
+def build_dashboard(user_id, today=None):
+    """
+    :param int user_id: auth User id
+    :param datetime.date today: Defaults to today in the current timezone
+    :return dict: JSON serializable dashboard data
+    """
+    today = today or date_windows.today()
+    week_start = today - datetime.timedelta(days=(today.weekday() + 1) % 7)
+    volume = ExerciseDailyVolume.objects.filter(exercise__routine__user__user_id=user_id)
+
+    week = volume.filter(day__gte=week_start, day__lte=today).aggregate(
+        sessions=Count('day', distinct=True),
+        tonnage=Sum('total_tonnage'),
+        sets=Sum('set_count'),
+    )
+    return {
+        'week_start': week_start.isoformat(),
+        'scheduled_routines': list(Routine.objects.filter(
+            user__user_id=user_id).ordered_by_day().values('id', 'name', 'day')),
+        'completed_sessions': week['sessions'],
+        'weekly_tonnage': week['tonnage'] or 0,
+        'weekly_sets': week['sets'] or 0,
+        'week_streak': week_streak(volume, week_start),
+        'recent_prs': recent_prs(volume, today),
+    }
+
+
+def week_streak(volume, week_start):
+    """
+    Consecutive weeks with at least one session, counting back from this week
+    (or last week, so a streak isn't broken just because this week's session hasn't happened yet)
+    """
+    streak = 0
+    expected = week_start
+    days = volume.filter(day__lte=week_start + datetime.timedelta(days=6)).order_by('-day').values_list(
+        'day', flat=True).distinct()
+    for day in days.iterator():
+        day_week = day - datetime.timedelta(days=(day.weekday() + 1) % 7)
+        if day_week == expected:
+            streak += 1
+            expected -= datetime.timedelta(days=7)
+        elif day_week < expected:
+            if streak == 0 and day_week == week_start - datetime.timedelta(days=7):
+                streak, expected = 1, day_week - datetime.timedelta(days=7)
+            else:
+                break
+    return streak
+
+
+def recent_prs(volume, today, days=RECENT_PR_DAYS):
+    """Days in the last `days` where an exercise's top weight beat everything before it"""
+    since = today - datetime.timedelta(days=days)
+    best = dict(volume.filter(day__lt=since).values('exercise_id').annotate(
+        best=Max('max_weight')).values_list('exercise_id', 'best'))
+    prs = []
+    recent = volume.filter(day__gte=since, day__lte=today).order_by('day').values_list(
+        'exercise_id', 'exercise__name', 'day', 'max_weight')
+    for exercise_id, name, day, max_weight in recent:
+        if max_weight > best.get(exercise_id, 0):
+            if exercise_id in best:  # The first time an exercise is logged isn't a record
+                prs.append({
+                    'exercise_id': exercise_id,
+                    'exercise': name,
+                    'day': day.isoformat(),
+                    'weight': max_weight,
+                    'previous_best': best[exercise_id],
+                })
+            best[exercise_id] = max_weight
+    prs.reverse()  # Newest first
+    return prs
@@ -0,0 +1,79 @@
+"""
+Half-open [start, end) datetime windows for calendar days, weeks and months in a timezone.
+
+History is filtered as timestamp >= start AND timestamp < end, which the (exercise, timestamp)
+index serves directly. Boundaries are computed in the user's timezone, so a day is 23 or 25 hours
+long across DST changes. The boundary arithmetic is memoized per (timezone, date).
+"""
+import datetime
+from functools import lru_cache
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+def local_date(value, tz=None):
+    """
+    The calendar date of a date or datetime in tz (default: the current timezone).
+    Naive datetimes are taken to already be local.
+    """
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value, tz or timezone.get_current_timezone())
+        return value.date()
+    return value
+
+
+def today(tz=None):
+    return local_date(timezone.now(), tz)
+
+
+@lru_cache(maxsize=4096)
+def _midnight(tz, day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), tz)
+
+
+def day_window(value=None, tz=None):
+    """
+    :param datetime.date|datetime.datetime value: Defaults to today
+    :param tzinfo tz: Defaults to the current timezone
+    :return tuple(datetime.datetime, datetime.datetime): Aware [start, end) of that calendar day
+    """
+    tz = tz or timezone.get_current_timezone()
+    day = local_date(value, tz) if value is not None else today(tz)
+    return _midnight(tz, day), _midnight(tz, day + datetime.timedelta(days=1))
+
+
+def date_range_window(start=None, end=None, tz=None, default_days=7):
+    """
+    Window from the start of `start` through the end of `end`, both inclusive calendar days.
+    Defaults to the last `default_days` days ending today.
+    """
+    tz = tz or timezone.get_current_timezone()
+    end_day = local_date(end, tz) if end is not None else today(tz)
+    start_day = local_date(start, tz) if start is not None else end_day - datetime.timedelta(days=default_days)
+    return _midnight(tz, start_day), _midnight(tz, end_day + datetime.timedelta(days=1))
+
+
+def week_window(value=None, tz=None):
+    """Window of the Sunday-first week (matching DAYS_OF_WEEK) containing value"""
+    tz = tz or timezone.get_current_timezone()
+    day = local_date(value, tz) if value is not None else today(tz)
+    start = day - datetime.timedelta(days=(day.weekday() + 1) % 7)
+    return _midnight(tz, start), _midnight(tz, start + datetime.timedelta(days=7))
+
+
+def month_window(value=None, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    day = local_date(value, tz) if value is not None else today(tz)
+    start = day.replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return _midnight(tz, start), _midnight(tz, end)
+
+
+def parse_day(value, default=None):
+    """Parse a YYYY-MM-DD request parameter, returning default when it is missing or malformed"""
+    try:
+        return parse_date(value) or default
+    except (TypeError, ValueError):
+        return default
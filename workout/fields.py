@@ -0,0 +1,124 @@
+"""
+Model fields that work on every database backend the project is configured for.
+
+PackedIntegerArrayField replaces django.contrib.postgres's ArrayField for the small fixed-size
+integer lists (sets, weights_per_set). Postgres keeps its native integer[] column, so nothing
+changes there; other backends store the list as packed little-endian 32-bit integers in a binary
+column, 4 bytes per element with no per-array header. Either way instances see plain lists, and
+hot paths that only need the numbers can read them through `as_buffer` without building a list.
+"""
+import array
+import json
+import struct
+import sys
+
+from django.core import exceptions, validators
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+TYPECODE = 'i'  # 32-bit signed, the same range as Postgres' integer
+NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little' and array.array(TYPECODE).itemsize == 4
+
+
+def pack(values):
+    """Pack a list of integers as little-endian int32 bytes"""
+    return struct.pack('<{}i'.format(len(values)), *values)
+
+
+def unpack(data):
+    """
+    View packed bytes as a sequence of ints. On little-endian machines this is a memoryview cast
+    of the stored bytes, with nothing copied; elsewhere the bytes are swapped into an array.
+
+    :param bytes|memoryview data:
+    :return memoryview|array.array:
+    """
+    if NATIVE_LITTLE_ENDIAN:
+        return memoryview(data).cast('B').cast(TYPECODE)
+    values = array.array(TYPECODE, bytes(data))
+    values.byteswap()
+    return values
+
+
+def as_buffer(value):
+    """
+    A buffer of native int32s for a value read from a PackedIntegerArrayField column,
+    e.g. to np.frombuffer it. Packed bytes are viewed without copying; Postgres lists are packed once.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return unpack(value)
+    return array.array(TYPECODE, value)
+
+
+def raw(name):
+    """
+    Select a PackedIntegerArrayField column as stored, skipping the conversion to a list, e.g.
+    queryset.annotate(raw_sets=raw('sets')). Read the values with as_buffer.
+    """
+    return models.ExpressionWrapper(models.F(name), output_field=models.BinaryField())
+
+
+class PackedIntegerArrayField(models.Field):
+    description = _('Array of up to %(size)s integers')
+    empty_strings_allowed = False
+    default_error_messages = {
+        'invalid': _('Enter a list of whole numbers.'),
+    }
+
+    def __init__(self, size=None, **kwargs):
+        self.size = size
+        super(PackedIntegerArrayField, self).__init__(**kwargs)
+        if self.size:
+            self.default_validators = self.default_validators[:]
+            self.default_validators.append(validators.MaxLengthValidator(self.size))
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(PackedIntegerArrayField, self).deconstruct()
+        if self.size is not None:
+            kwargs['size'] = self.size
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            # Identical to ArrayField(IntegerField(), size=size), so switching fields is a no-op there
+            return 'integer[{}]'.format(self.size or '')
+        return connection.data_types['BinaryField']
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        value = [int(x) for x in value]
+        if connection.vendor == 'postgresql':
+            return value
+        return connection.Database.Binary(pack(value))
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None or isinstance(value, list):
+            return value
+        return unpack(value).tolist()
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return unpack(value).tolist()
+        try:
+            if isinstance(value, str):
+                value = json.loads(value)  # As written by value_to_string, e.g. in fixtures
+            return [int(x) for x in value]
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid')
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
+
+    def formfield(self, **kwargs):
+        from django import forms
+        from django.contrib.postgres.forms import SimpleArrayField
+        defaults = {
+            'form_class': SimpleArrayField,
+            'base_field': forms.IntegerField(),
+            'max_length': self.size,
+        }
+        defaults.update(kwargs)
+        return super(PackedIntegerArrayField, self).formfield(**defaults)
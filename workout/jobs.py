@@ -0,0 +1,156 @@
+"""
+A small database-backed job queue, so heavy recomputation can leave the request cycle.
+
+Tasks are plain functions registered with @task('name'). enqueue() stores a Job row in the
+caller's transaction, so workers only see it once that transaction commits.
+`manage.py run_workers` runs them on a thread pool. A job is claimed with a conditional
+UPDATE, so any number of workers can share the table without a broker or row locks. Pending
+jobs with the same key are deduplicated, and failures are retried with exponential backoff.
+
+With WORKOUT_JOBS_EAGER = True, enqueue() runs the task inline instead, which is handy in tests.
+"""
+import datetime
+import json
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+STALE_AFTER = datetime.timedelta(minutes=10)  # RUNNING jobs locked this long ago are assumed orphaned
+
+
+def task(name):
+    """Register a function as a task that can be enqueued by name"""
+    def decorator(func):
+        REGISTRY[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, key=None, max_attempts=3, delay=0, **kwargs):
+    """
+    Queue the task `name` to be called with kwargs, which must be JSON serializable.
+    If a pending job with the same key exists it is reused instead of adding another.
+
+    :return Job: The queued job, or None when it ran eagerly
+    """
+    if name not in REGISTRY:
+        raise KeyError('Unknown task: {}'.format(name))
+    payload = json.dumps(kwargs, cls=DjangoJSONEncoder)
+    if getattr(settings, 'WORKOUT_JOBS_EAGER', False):
+        REGISTRY[name](**json.loads(payload))
+        return None
+
+    job = Job(name=name, key=key, payload=payload, max_attempts=max_attempts,
+              run_at=timezone.now() + datetime.timedelta(seconds=delay))
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.filter(key=key).first()
+
+
+def requeue_stale():
+    """Put back jobs whose worker died mid-run"""
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - STALE_AFTER).update(
+        status=Job.PENDING, locked_at=None)
+
+
+def claim_next():
+    """
+    Claim the next due job for this worker. Claiming clears its key, so changes enqueued
+    while it runs get a new job instead of being folded into this one.
+
+    :return Job: or None when nothing is due
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.PENDING, run_at__lte=now).order_by('run_at', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING, locked_at=now, key=None, attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job):
+    try:
+        with transaction.atomic():
+            REGISTRY[job.name](**json.loads(job.payload))
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            logger.error('Job %s failed permanently:\n%s', job, job.last_error)
+        else:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + datetime.timedelta(seconds=2 ** job.attempts)
+        job.locked_at = None
+        job.save(update_fields=['status', 'run_at', 'locked_at', 'last_error', 'updated_at'])
+        return False
+    job.status = Job.DONE
+    job.locked_at = None
+    job.save(update_fields=['status', 'locked_at', 'updated_at'])
+    return True
+
+
+def worker_loop(stop, once=False, poll_interval=1.0):
+    """Claim and run jobs until stopped, or until none are due when once is True"""
+    processed = 0
+    while not stop.is_set():
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim_next()
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def _pool_worker(stop, once, poll_interval):
+    try:
+        return worker_loop(stop, once, poll_interval)
+    finally:
+        connection.close()  # Each thread has its own connection
+
+
+def work(concurrency=1, once=False, poll_interval=1.0, stop=None):
+    """
+    Run jobs on `concurrency` threads. A single worker runs in the calling thread.
+
+    :return int: Number of jobs processed
+    """
+    stop = stop or threading.Event()
+    requeue_stale()
+    if concurrency <= 1:
+        try:
+            return worker_loop(stop, once, poll_interval)
+        except KeyboardInterrupt:
+            stop.set()
+            return 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_pool_worker, stop, once, poll_interval) for _ in range(concurrency)]
+        try:
+            return sum(x.result() for x in futures)
+        except KeyboardInterrupt:
+            stop.set()
+            return sum(x.result() for x in futures)
@@ -0,0 +1,101 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from workout.fields import as_buffer, pack, raw, unpack
+from workout.models import Exercise, ExerciseHistory
+
+
+class Rollback(Exception):
+    """Raised to throw away the synthetic benchmark rows"""
+
+
+class Command(BaseCommand):
+    help = ('Compare the row size and decode cost of packed sets/weights against Postgres integer[] '
+            '(what ArrayField stores), in process and through the configured database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        values = [[rng.randint(1, 500) for _ in range(rng.randint(3, 10))] for _ in range(options['rows'])]
+        self.stdout.write('{} arrays of 3-10 integers on {}\n'.format(len(values), connection.vendor))
+        self.report_sizes(values)
+        self.report_decoding(values, options['repeat'])
+        try:
+            with transaction.atomic():
+                self.report_queries(values, options['batch_size'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            self.stdout.write('Synthetic rows rolled back.')
+
+    def report_sizes(self, values):
+        self.stdout.write('Bytes per array')
+        packed = [pack(x) for x in values]
+        if connection.vendor == 'postgresql':
+            sample = values[:1000]
+            with connection.cursor() as cursor:
+                cursor.execute(' UNION ALL '.join(
+                    ['SELECT pg_column_size(%s::integer[]), pg_column_size(%s::bytea)'] * len(sample)),
+                    [param for x in sample for param in (x, pack(x))])
+                sizes = cursor.fetchall()
+            self.line('integer[] (pg_column_size)', sum(x[0] for x in sizes) / len(sizes))
+            self.line('packed bytea (pg_column_size)', sum(x[1] for x in sizes) / len(sizes))
+        else:
+            # A one-dimensional int4 array without NULLs: 24 byte header, less 3 when stored with a short varlena header
+            self.line('integer[] (estimated)', sum(21 + 4 * len(x) for x in values) / len(values))
+            self.line('packed', sum(len(x) for x in packed) / len(packed))
+
+    def report_decoding(self, values, repeat):
+        self.stdout.write('\nDecode cost per array, in process')
+        packed = [pack(x) for x in values]
+        cases = [
+            ('packed -> memoryview', lambda: [unpack(x) for x in packed]),
+            ('packed -> list', lambda: [unpack(x).tolist() for x in packed]),
+        ]
+        if connection.vendor == 'postgresql':
+            import psycopg2.extensions
+            literals = ['{' + ','.join(map(str, x)) + '}' for x in values]
+            raw_cursor = connection.cursor().cursor
+            cases.append(('integer[] text -> list (psycopg2)', lambda: [
+                psycopg2.extensions.INTEGERARRAY(x, raw_cursor) for x in literals]))
+        self.time_cases(cases, len(values), repeat)
+
+    def report_queries(self, values, batch_size, repeat):
+        self.stdout.write('\nReading {} rows from {}'.format(len(values), ExerciseHistory._meta.db_table))
+        exercise = Exercise.objects.create()
+        now = timezone.now()
+        for start in range(0, len(values), batch_size):
+            ExerciseHistory.objects.bulk_create([
+                ExerciseHistory(exercise=exercise, timestamp=now, sets=x, weights_per_set=x)
+                for x in values[start:start + batch_size]
+            ])
+        history = ExerciseHistory.objects.filter(exercise=exercise)
+        with connection.cursor() as cursor:
+            size = 'pg_column_size' if connection.vendor == 'postgresql' else 'length'
+            cursor.execute('SELECT avg({}(sets)) FROM {} WHERE exercise_id = %s'.format(
+                size, ExerciseHistory._meta.db_table), [exercise.id])
+            self.line('stored bytes per array ({})'.format(size), float(cursor.fetchone()[0]))
+        self.time_cases([
+            ('values_list as lists', lambda: list(history.values_list('sets', flat=True))),
+            ('values_list as buffers', lambda: [
+                as_buffer(x) for x in history.annotate(raw_sets=raw('sets')).values_list('raw_sets', flat=True)]),
+        ], len(values), repeat)
+
+    def time_cases(self, cases, count, repeat):
+        for name, run in cases:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            self.line(name, min(timings) / count * 1000000, 'us')
+
+    def line(self, name, value, unit=''):
+        self.stdout.write('  {:<40} {:>10.2f} {}'.format(name, value, unit).rstrip())
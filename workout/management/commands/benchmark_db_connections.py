@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from workout.profiling import percentiles
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request latency of opening a new database connection for every request '
+            'against reusing a persistent or pooled one. Point PYFIT_DB_* at a local Postgres first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Warning: {} is {}, connection costs will not reflect Postgres'.format(
+                options['database'], connection.vendor))
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+
+        self.stdout.write('{:<34}{:>10}{:>10}{:>10}'.format('mode', 'p50 ms', 'p95 ms', 'p99 ms'))
+        # Closing after every request is what CONN_MAX_AGE = 0 does; with the pooled engine it returns to the pool
+        label = 'pool checkout per request' if connection.settings_dict.get('POOL') else 'new connection per request'
+        self.report(label, self.measure(connection, options['requests'], close_each=True))
+        self.report('persistent connection', self.measure(connection, options['requests'], close_each=False))
+
+    @staticmethod
+    def measure(connection, requests, close_each):
+        connection.close()
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            if close_each:
+                connection.close()
+            timings.append((time.perf_counter() - start) * 1000)
+        return percentiles(timings)
+
+    def report(self, label, result):
+        self.stdout.write('{:<34}{:>10.3f}{:>10.3f}{:>10.3f}'.format(label, result['p50'], result['p95'], result['p99']))
@@ -0,0 +1,223 @@
+import datetime
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from workout import cardio, synthetic
+from workout.models import CardioSession, Exercise, ExerciseHistory, Routine
+from workout.profiling import percentiles
+from workout.urls import urlpatterns
+
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+
+class Rollback(Exception):
+    """Raised to throw away everything the write endpoints created"""
+
+
+def scenarios():
+    """
+    How to request every named URL in workout.urls. Each entry takes the benchmark
+    fixture dict and returns (method, path, data, extra). Called once per request, so
+    delete endpoints can create the row they remove.
+    """
+    def new_routine(f):
+        return f['profile'].add_routine(name='Benchmark', day='MONDAY')
+
+    def new_exercise(f):
+        return f['routine'].add_exercise(name='BENCH_PRESS', sets=[5, 5, 5])
+
+    def new_history(f):
+        return f['exercise'].add_history(sets=[5, 5, 5], weights_per_set=[100, 100, 100])
+
+    def hour_run():
+        return {
+            'interval': 1,
+            'heart_rate': [140 + x % 30 for x in range(3600)],
+            'pace': [300 + x % 20 for x in range(3600)],
+            'distance': [x * 3.3 for x in range(3600)],
+        }
+
+    week_ago = (timezone.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
+    today = timezone.now().strftime('%Y-%m-%d')
+    return {
+        'login': lambda f: ('get', reverse('login'), {}, {}),
+        'signup': lambda f: ('get', reverse('signup'), {}, {}),
+        'dashboard': lambda f: ('get', reverse('dashboard'), {}, {}),
+        'add_routine': lambda f: ('post', reverse('add_routine'), {'name': 'Benchmark', 'day': 'FRIDAY'}, AJAX),
+        'routine_list': lambda f: ('get', reverse('routine_list'), {}, {}),
+        'routine_detail': lambda f: ('get', reverse('routine_detail', kwargs={'routine_id': f['routine'].id}), {}, {}),
+        'bulk_routines': lambda f: ('post', reverse('bulk_routines'), json.dumps({
+            'action': 'update', 'changes': [{'id': f['routine'].id, 'name': 'Renamed'}]
+        }), {'content_type': 'application/json'}),
+        'delete_routine': lambda f: ('post', reverse('delete_routine'), {'routine_id': new_routine(f).id}, AJAX),
+        'edit_routine': lambda f: (
+            'post', reverse('edit_routine'), {'routine_id': f['routine'].id, 'name': 'Renamed'}, AJAX),
+        'add_exercise': lambda f: ('post', reverse('add_exercise'), {
+            'routine_id': f['routine'].id, 'sets': '5, 5, 5', 'name': 'BENCH_PRESS'}, AJAX),
+        'bulk_exercises': lambda f: ('post', reverse('bulk_exercises'), json.dumps({
+            'action': 'reorder', 'routine_id': f['routine'].id, 'ids': [x.id for x in reversed(f['exercises'])]
+        }), {'content_type': 'application/json'}),
+        'delete_exercise': lambda f: ('post', reverse('delete_exercise'), {'exercise_id': new_exercise(f).id}, AJAX),
+        'exercise_detail': lambda f: (
+            'get', reverse('exercise_detail', kwargs={'exercise_id': f['exercise'].id}), {}, {}),
+        'edit_exercise': lambda f: (
+            'post', reverse('edit_exercise'), {'exercise_id': f['exercise'].id, 'rest_duration': 90}, AJAX),
+        'add_exercise_history': lambda f: (
+            'post', reverse('add_exercise_history', kwargs={'exercise_id': f['exercise'].id}),
+            {'sets': '5, 5, 5', 'weights_per_set': '100, 100, 100'}, AJAX),
+        'log_session': lambda f: ('post', reverse('log_session'), json.dumps({'exercises': [
+            {'exercise_id': x.id, 'sets': [5, 5, 5], 'weights_per_set': [100, 100, 100]} for x in f['exercises']
+        ]}), {'content_type': 'application/json'}),
+        'edit_exercise_history': lambda f: (
+            'post', reverse('edit_exercise_history', kwargs={'history_id': f['history'].id}),
+            {'sets': '5, 5, 4', 'weights_per_set': '100, 100, 100'}, AJAX),
+        'delete_exercise_history': lambda f: (
+            'post', reverse('delete_exercise_history', kwargs={'history_id': new_history(f).id}), {}, AJAX),
+        'exercise_history_list': lambda f: (
+            'get', reverse('exercise_history_list', kwargs={'exercise_id': f['exercise'].id}),
+            {'start_date': week_ago, 'end_date': today}, AJAX),
+        'exercise_history_detail': lambda f: (
+            'get', reverse('exercise_history_detail', kwargs={'history_id': f['history'].id}), {}, AJAX),
+        'export_history': lambda f: ('get', reverse('export_history'), {'format': 'ndjson'}, {}),
+        'exercise_analytics': lambda f: (
+            'get', reverse('exercise_analytics', kwargs={'exercise_id': f['exercise'].id}), {}, {}),
+        'profiling_stats': lambda f: ('get', reverse('profiling_stats'), {}, {}),
+        'sync': lambda f: ('get', reverse('sync'), {}, {}),
+        'log_cardio': lambda f: (
+            'post', reverse('log_cardio', kwargs={'exercise_id': f['cardio_exercise'].id}), json.dumps(hour_run()),
+            {'content_type': 'application/json'}),
+        'cardio_samples': lambda f: (
+            'get', reverse('cardio_samples', kwargs={'history_id': f['cardio_session'].pk}), {'points': 300}, {}),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Drive every workout URL through the Django test client against the configured database and '
+            'report latency percentiles, queries per request and throughput. Writes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--user', help='Username to benchmark as. Defaults to generating a synthetic user')
+        parser.add_argument('--years', type=float, default=2, help='History to generate for the synthetic user')
+        parser.add_argument('--only', action='append', help='Only benchmark these URL names (repeatable)')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        results = {}
+        try:
+            with transaction.atomic():
+                results = self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'iterations': options['iterations'],
+                'timestamp': timezone.now().isoformat(),
+            },
+            'results': results,
+        }
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)['results']
+        self.print_report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write('Saved results to {}'.format(options['output']))
+
+    def run(self, options):
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('No user named "{}"'.format(options['user']))
+        else:
+            synthetic.generate(users=1, years=options['years'])
+            user = User.objects.filter(username__startswith='synthetic-').latest('id')
+        user.is_staff = True  # So staff-only endpoints are measured too
+        user.save()
+
+        routine = Routine.objects.filter(user__user=user).first()
+        exercise = Exercise.objects.filter(routine=routine).first()
+        if exercise is None:
+            raise CommandError('User "{}" needs at least one routine with an exercise'.format(user.username))
+        fixture = {
+            'user': user,
+            'profile': user.user_profile,
+            'routine': routine,
+            'exercise': exercise,
+            'exercises': list(routine.exercises.all()),
+            'history': ExerciseHistory.objects.filter(exercise=exercise).last() or exercise.add_history(),
+            'cardio_exercise': routine.add_exercise(name='Run', exercise_type='CARDIO'),
+        }
+        fixture['cardio_session'] = CardioSession.objects.create(
+            history=fixture['cardio_exercise'].history.create(sets=[], weights_per_set=[]), sample_count=3600,
+            **{name: cardio.pack(name, range(3600)) for name in cardio.SERIES})
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        specs = scenarios()
+        names = [x.name for x in urlpatterns if getattr(x, 'name', None)]  # Skips included url confs
+        results = {}
+        for name in names:
+            if options['only'] and name not in options['only']:
+                continue
+            if name not in specs:
+                self.stderr.write('No benchmark scenario for "{}", skipping'.format(name))
+                continue
+            results[name] = self.measure(client, specs[name], fixture, options['iterations'], options['warmup'])
+        return results
+
+    @staticmethod
+    def measure(client, spec, fixture, iterations, warmup):
+        timings, queries, statuses = [], [], set()
+        for iteration in range(warmup + iterations):
+            method, path, data, extra = spec(fixture)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, data, **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+                statuses.add(response.status_code)
+        latency = percentiles(timings)
+        return {
+            'p50_ms': round(latency['p50'], 3),
+            'p95_ms': round(latency['p95'], 3),
+            'p99_ms': round(latency['p99'], 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries_per_request': round(sum(queries) / float(len(queries)), 2),
+            'max_queries': max(queries),
+            'throughput_rps': round(len(timings) / (sum(timings) / 1000.0), 1),
+            'status_codes': sorted(statuses),
+        }
+
+    def print_report(self, results, previous):
+        self.stdout.write('{:<26}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+            'url name', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'req/s', 'p50 change'))
+        for name, result in sorted(results.items()):
+            change = ''
+            if name in previous and previous[name]['p50_ms']:
+                change = '{:+.1f}%'.format((result['p50_ms'] / previous[name]['p50_ms'] - 1) * 100)
+            self.stdout.write('{:<26}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.1f}{:>10.1f}{:>12}'.format(
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries_per_request'], result['throughput_rps'], change))
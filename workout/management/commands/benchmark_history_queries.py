@@ -0,0 +1,77 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from workout.models import Exercise, ExerciseHistory
+
+
+class Rollback(Exception):
+    """Raised to throw away the synthetic benchmark rows"""
+
+
+class Command(BaseCommand):
+    help = 'Print the query plan and latency of the ExerciseHistory date queries against synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['batch_size'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            self.stdout.write('Synthetic rows rolled back.')
+
+    def run(self, rows, batch_size, repeat):
+        exercise = Exercise.objects.create()
+        other = Exercise.objects.create()
+        now = timezone.now()
+        self.stdout.write('Inserting {} history rows...'.format(rows))
+        batch = []
+        for i in range(rows):
+            batch.append(ExerciseHistory(
+                exercise=exercise if i % 2 else other,
+                timestamp=now - datetime.timedelta(minutes=random.randint(0, 60 * 24 * 365 * 5)),
+                sets=[8, 8, 8],
+                weights_per_set=[100, 100, 100],
+            ))
+            if len(batch) >= batch_size:
+                ExerciseHistory.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            ExerciseHistory.objects.bulk_create(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE {}'.format(ExerciseHistory._meta.db_table))
+
+        queries = (
+            ('get_history_by_day', exercise.get_history_by_day(now - datetime.timedelta(days=30))),
+            ('get_history_by_date_range', exercise.get_history_by_date_range(
+                now - datetime.timedelta(days=37), now - datetime.timedelta(days=30))),
+        )
+        for name, queryset in queries:
+            self.stdout.write('\n{}'.format(name))
+            self.print_plan(queryset)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write('  rows: {}  median: {:.2f}ms  max: {:.2f}ms'.format(
+                queryset.count(), timings[len(timings) // 2], timings[-1]))
+
+    def print_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            for row in cursor.fetchall():
+                self.stdout.write('  ' + ' '.join(str(col) for col in row))
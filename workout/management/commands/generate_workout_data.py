@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from workout import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, routines, exercises and years of exercise history for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--routines', type=int, default=3, help='Routines per user')
+        parser.add_argument('--exercises', type=int, default=5, help='Exercises per routine')
+        parser.add_argument('--years', type=float, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        created = synthetic.generate(
+            users=options['users'],
+            routines_per_user=options['routines'],
+            exercises_per_routine=options['exercises'],
+            years=options['years'],
+            seed=options['seed'],
+        )
+        self.stdout.write('Created {users} users, {routines} routines, {exercises} exercises and '
+                          '{history} history rows'.format(**created) +
+                          ' in {:.1f}s'.format(time.perf_counter() - start))
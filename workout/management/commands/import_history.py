@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from workout.models import Exercise, ExerciseHistory, bulk_create_history
+
+
+def parse_int_list(value):
+    """Accepts a JSON list or a comma separated string such as '8, 8, 6'"""
+    if isinstance(value, list):
+        return [int(x) for x in value]
+    if not value:
+        return []
+    return [int(x) for x in str(value).strip('[]').split(',') if x.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Import ExerciseHistory from a CSV or JSONL file. Each record needs an "exercise" (id or name), '
+            'a "timestamp", "sets" and "weights_per_set", and may have "notes".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', help='Required. Username whose exercises the records belong to')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Not required=True: call_command doesn't pass keyword options through the parser on Django 1.10
+        if not options['user']:
+            raise CommandError('Pass --user, the username whose exercises the records belong to')
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Unknown format "{}", pass --format csv or --format jsonl'.format(file_format))
+
+        lookup = self.build_lookup(options['user'])
+        if not lookup:
+            raise CommandError('User "{}" has no exercises to import into'.format(options['user']))
+
+        imported = skipped = 0
+        started = time.perf_counter()
+        with io.open(options['path'], encoding='utf-8', newline='') as f:
+            rows = self.read_csv(f) if file_format == 'csv' else self.read_jsonl(f)
+            for batch, batch_skipped in self.batches(self.histories(rows, lookup), options['batch_size']):
+                self.save_batch(batch)
+                imported += len(batch)
+                skipped += batch_skipped
+                elapsed = time.perf_counter() - started
+                self.stdout.write('{} rows imported ({:.0f} rows/sec)'.format(imported, imported / elapsed))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Imported {} rows, skipped {} in {:.2f}s ({:.0f} rows/sec)'.format(
+            imported, skipped, elapsed, imported / elapsed if elapsed else 0))
+
+    @staticmethod
+    def build_lookup(username):
+        """Map exercise ids, names and display names to exercise ids, loaded in a single query"""
+        lookup = {}
+        exercises = Exercise.objects.filter(routine__user__user__username=username).order_by('-id')
+        for exercise in exercises.only('id', 'name'):
+            lookup[str(exercise.id)] = exercise.id
+            lookup[exercise.name.lower()] = exercise.id
+            lookup[exercise.get_name_display().lower()] = exercise.id
+        return lookup
+
+    @staticmethod
+    def read_csv(f):
+        for row in csv.DictReader(f):
+            yield row
+
+    def read_jsonl(self, f):
+        """Yield a dict per non-blank line, or None for lines that aren't a JSON object"""
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                self.stderr.write('Skipping line {}: not a JSON object'.format(number))
+                record = None
+            yield record
+
+    def histories(self, rows, lookup):
+        """Yield an unsaved ExerciseHistory per row, or None for rows that can't be imported"""
+        for line, row in enumerate(rows, start=1):
+            if row is None:
+                yield None
+                continue
+            exercise_id = lookup.get(str(row.get('exercise', '')).strip().lower())
+            timestamp = parse_datetime(row.get('timestamp') or '')
+            if exercise_id is None or timestamp is None:
+                self.stderr.write('Skipping record {}: unknown exercise or bad timestamp'.format(line))
+                yield None
+                continue
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            try:
+                sets = parse_int_list(row.get('sets'))
+                weights_per_set = parse_int_list(row.get('weights_per_set'))
+            except ValueError:
+                self.stderr.write('Skipping record {}: sets and weights must be integers'.format(line))
+                yield None
+                continue
+            yield ExerciseHistory(
+                exercise_id=exercise_id,
+                timestamp=timestamp,
+                sets=sets,
+                weights_per_set=weights_per_set,
+                notes=row.get('notes') or '',
+            )
+
+    @staticmethod
+    def batches(histories, batch_size):
+        batch, skipped = [], 0
+        for history in histories:
+            if history is None:
+                skipped += 1
+                continue
+            batch.append(history)
+            if len(batch) >= batch_size:
+                yield batch, skipped
+                batch, skipped = [], 0
+        if batch or skipped:
+            yield batch, skipped
+
+    @staticmethod
+    def save_batch(batch):
+        with transaction.atomic():
+            bulk_create_history(batch)
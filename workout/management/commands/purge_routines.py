@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from workout.models import Routine
+from workout.purge import PURGE_BATCH_SIZE, purge_routine
+
+
+class Command(BaseCommand):
+    help = ('Purge soft-deleted routines and their exercises and history now, a batch per transaction, '
+            'instead of waiting for the purge_routine jobs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routine', type=int, action='append', dest='routine_ids',
+                            help='Only purge these routine ids (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        routines = Routine.all_objects.filter(deleted_at__isnull=False).order_by('id')
+        if options['routine_ids']:
+            routines = routines.filter(pk__in=options['routine_ids'])
+
+        for routine_id in list(routines.values_list('id', flat=True)):
+            def progress(result):
+                if not result['done']:
+                    self.stdout.write('  routine {}: deleted {} history rows, {} remaining'.format(
+                        routine_id, result['deleted'], result['remaining']))
+            deleted = purge_routine(routine_id, options['batch_size'], progress)
+            self.stdout.write('Purged routine {} and {} history rows.'.format(routine_id, deleted))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from workout.models import ExerciseDailyVolume, ExerciseHistory, history_day
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ExerciseDailyVolume rollup table from ExerciseHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, action='append', dest='exercise_ids',
+                            help='Only rebuild these exercise ids (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        history = ExerciseHistory.objects.order_by('exercise_id', 'timestamp').only(
+            'exercise_id', 'timestamp', 'sets', 'weights_per_set')
+        rollups = ExerciseDailyVolume.objects.all()
+        if options['exercise_ids']:
+            history = history.filter(exercise_id__in=options['exercise_ids'])
+            rollups = rollups.filter(exercise_id__in=options['exercise_ids'])
+
+        created = 0
+        with transaction.atomic():
+            rollups.delete()
+            batch = []
+            for key, group in self.group_by_day(history.iterator()):
+                batch.append(ExerciseDailyVolume(exercise_id=key[0], day=key[1], **ExerciseDailyVolume.totals(group)))
+                if len(batch) >= options['batch_size']:
+                    ExerciseDailyVolume.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            ExerciseDailyVolume.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write('Rebuilt {} daily volume rows.'.format(created))
+
+    @staticmethod
+    def group_by_day(history):
+        """Yield ((exercise_id, day), [ExerciseHistory]) from history ordered by exercise and timestamp"""
+        key, group = None, []
+        for row in history:
+            row_key = (row.exercise_id, history_day(row.timestamp))
+            if row_key != key and group:
+                yield key, group
+                group = []
+            key = row_key
+            group.append(row)
+        if group:
+            yield key, group
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from workout.models import Exercise
+
+
+class Command(BaseCommand):
+    help = ('Recompute the history summary on Exercise (last performed, last sets and weights, '
+            'best estimated 1RM and session count) from ExerciseHistory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, action='append', dest='exercise_ids',
+                            help='Only rebuild these exercise ids (repeatable)')
+
+    def handle(self, *args, **options):
+        exercise_ids = Exercise.objects.order_by('id').values_list('id', flat=True)
+        if options['exercise_ids']:
+            exercise_ids = exercise_ids.filter(pk__in=options['exercise_ids'])
+
+        rebuilt = 0
+        for exercise_id in exercise_ids.iterator():
+            # One short transaction per exercise, so concurrent logging isn't blocked for the whole rebuild
+            with transaction.atomic():
+                rebuilt += Exercise.refresh_summary(exercise_id)
+        self.stdout.write('Rebuilt {} exercise summaries.'.format(rebuilt))
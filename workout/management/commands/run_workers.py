@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from workout import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the workout job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are due instead of polling')
+
+    def handle(self, *args, **options):
+        processed = jobs.work(
+            concurrency=options['concurrency'],
+            once=options['once'],
+            poll_interval=options['poll_interval'],
+        )
+        self.stdout.write('Processed {} jobs.'.format(processed))
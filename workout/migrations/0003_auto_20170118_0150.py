@@ -2,7 +2,7 @@
 # Generated by Django 1.10.5 on 2017-01-18 01:50
 from __future__ import unicode_literals
 
-import django.contrib.postgres.fields
+import workout.fields
 from django.db import migrations, models
 
 
@@ -21,6 +21,6 @@ class Migration(migrations.Migration):
         migrations.AddField(
             model_name='workout',
             name='sets',
-            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(default=10), default=[], size=10),
+            field=workout.fields.PackedIntegerArrayField(default=[], size=10),
         ),
     ]
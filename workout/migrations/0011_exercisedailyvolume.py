@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0010_exercisehistory_exercise_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseDailyVolume',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_reps', models.IntegerField(default=0)),
+                ('total_tonnage', models.BigIntegerField(default=0)),
+                ('set_count', models.IntegerField(default=0)),
+                ('max_weight', models.IntegerField(default=0)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_volume', to='workout.Exercise')),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='exercisedailyvolume',
+            unique_together=set([('exercise', 'day')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0011_exercisedailyvolume'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='exercisehistory',
+            index_together=set([('exercise', 'timestamp', 'id')]),
+        ),
+    ]
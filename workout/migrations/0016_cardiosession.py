@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0015_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardioSession',
+            fields=[
+                ('history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cardio', serialize=False, to='workout.ExerciseHistory')),
+                ('interval', models.FloatField(default=1.0)),
+                ('sample_count', models.IntegerField(default=0)),
+                ('heart_rate', models.BinaryField(null=True)),
+                ('pace', models.BinaryField(null=True)),
+                ('distance', models.BinaryField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import workout.fields
+
+
+class Migration(migrations.Migration):
+    """
+    On Postgres PackedIntegerArrayField keeps the integer[10] column type, so this changes nothing.
+    The earlier migrations that created these columns with ArrayField now use PackedIntegerArrayField
+    too, which is the same on Postgres and lets a fresh database on any other backend migrate, so this
+    only records the new default there. Move data between backends with dumpdata/loaddata, which
+    write these fields as JSON lists.
+    """
+
+    dependencies = [
+        ('workout', '0016_cardiosession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exercise',
+            name='sets',
+            field=workout.fields.PackedIntegerArrayField(default=list, size=10),
+        ),
+        migrations.AlterField(
+            model_name='exercisehistory',
+            name='sets',
+            field=workout.fields.PackedIntegerArrayField(default=list, size=10),
+        ),
+        migrations.AlterField(
+            model_name='exercisehistory',
+            name='weights_per_set',
+            field=workout.fields.PackedIntegerArrayField(default=list, size=10),
+        ),
+    ]
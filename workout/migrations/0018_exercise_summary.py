@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import workout.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0017_packed_integer_arrays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='last_performed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='last_sets',
+            field=workout.fields.PackedIntegerArrayField(default=list, size=10),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='last_weights_per_set',
+            field=workout.fields.PackedIntegerArrayField(default=list, size=10),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='best_one_rep_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='session_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
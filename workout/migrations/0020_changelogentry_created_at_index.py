@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0019_routine_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='changelogentry',
+            index_together=set([('user', 'id'), ('user', 'created_at')]),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+BATCH_SIZE = 5000
+# (sync model name, model, lookup of the owning profile's id), parents before children
+SOURCES = (
+    ('routine', 'Routine', 'user_id'),
+    ('exercise', 'Exercise', 'routine__user_id'),
+    ('history', 'ExerciseHistory', 'exercise__routine__user_id'),
+)
+
+
+def backfill_change_log(apps, schema_editor):
+    """
+    Log a create for every owned row that has never been logged: rows from before the change log
+    existed, and rows written with bulk_create, which sends no signals. Without an entry a client's
+    full sync never receives them.
+    """
+    ChangeLogEntry = apps.get_model('workout', 'ChangeLogEntry')
+    for name, model_name, owner in SOURCES:
+        model = apps.get_model('workout', model_name)
+        logged = ChangeLogEntry.objects.filter(model=name).values('object_id')
+        rows = model.objects.filter(**{owner + '__isnull': False}).exclude(id__in=logged).order_by('id')
+        rows = list(rows.values_list('id', owner))  # Read before writing to the log the query excludes by
+        for start in range(0, len(rows), BATCH_SIZE):
+            ChangeLogEntry.objects.bulk_create([
+                ChangeLogEntry(user_id=profile_id, model=name, object_id=object_id, action='create')
+                for object_id, profile_id in rows[start:start + BATCH_SIZE]
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0020_changelogentry_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_change_log, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,15 @@
+import copy
 import datetime
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import ArrayField
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import connection, models
+from django.db.models.signals import class_prepared, post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.urls import reverse
 
-from .constants import DAYS_OF_WEEK, USER_TYPES, EXERCISE_TYPES, EXERCISES
+from . import analytics, cardio, date_windows
+from .fields import PackedIntegerArrayField
+from .constants import DAYS_OF_WEEK, DAY_ORDINALS, USER_TYPES, EXERCISE_TYPES, EXERCISES
 
 
 @receiver(post_save, sender=User)
@@ -16,16 +18,105 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 class ModelMixin(object):
+    """
+    Tracks which concrete fields changed since the instance was loaded or last saved,
+    so updates write only those columns and skip the save entirely when nothing changed.
+    """
+    def snapshot_fields(self):
+        self._loaded_values = {
+            f.attname: copy.copy(self.__dict__[f.attname])  # Copy so in place edits of array fields show up
+            for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
+    def get_dirty_fields(self):
+        """Names of the concrete fields whose values differ from the last load or save"""
+        loaded = getattr(self, '_loaded_values', {})
+        return [f.name for f in self._meta.concrete_fields
+                if f.attname in loaded and self.__dict__.get(f.attname) != loaded[f.attname]]
+
+    def save_dirty(self):
+        """
+        Save only the changed columns, plus any auto_now fields.
+
+        :return bool: Whether anything was written
+        """
+        if self.pk is None:
+            self.save()
+            return True
+        dirty = self.get_dirty_fields()
+        if not dirty:
+            return False
+        auto_now = [f.name for f in self._meta.concrete_fields if getattr(f, 'auto_now', False)]
+        self.save(update_fields=set(dirty + auto_now))
+        return True
+
     def update(self, **kwargs):
         for k, v in kwargs.items():
             if hasattr(self, k) and getattr(self, k) != v:
                 setattr(self, k, v)
-        self.save()
+        return self.save_dirty()
+
+
+def snapshot_model_fields(sender, instance, **kwargs):
+    instance.snapshot_fields()
+
+
+@receiver(class_prepared)
+def connect_snapshots(sender, **kwargs):
+    # Per model, so instances of models without ModelMixin don't run a receiver at all
+    if issubclass(sender, ModelMixin):
+        post_init.connect(snapshot_model_fields, sender=sender)
+        post_save.connect(snapshot_model_fields, sender=sender)
+
+
+def bulk_update_fields(queryset, changes):
+    """
+    Apply per-row changes to the rows of queryset as a single UPDATE, one CASE expression per field.
+    Rows of queryset that have no change for a field keep their value. Sends no signals.
+
+    :param QuerySet queryset: Rows allowed to change, e.g. already filtered to the owner
+    :param dict changes: {pk: {field_name: value}}
+    :return int: Number of rows updated
+    """
+    if not changes:
+        return 0
+    model = queryset.model
+    fields = set(name for values in changes.values() for name in values)
+    assignments = {}
+    for name in fields:
+        field = model._meta.get_field(name)
+        whens = [models.When(pk=pk, then=models.Value(values[name], output_field=field))
+                 for pk, values in changes.items() if name in values]
+        assignments[field.attname] = models.Case(*whens, default=models.F(field.attname), output_field=field)
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False):
+            assignments[field.attname] = timezone.now()
+    return queryset.filter(pk__in=list(changes)).update(**assignments)
+
+
+class RoutineQuerySet(models.QuerySet):
+    def with_day_ordinal(self):
+        """Annotate each routine with its position in DAYS_OF_WEEK so the week can be ordered in SQL"""
+        return self.annotate(day_ordinal=models.Case(
+            *[models.When(day=day, then=models.Value(index)) for day, index in DAY_ORDINALS.items()],
+            output_field=models.IntegerField()
+        ))
+
+    def ordered_by_day(self):
+        return self.with_day_ordinal().order_by('day_ordinal', 'id')
+
+
+class RoutineManager(models.Manager.from_queryset(RoutineQuerySet)):
+    """Routines that haven't been deleted. Deleted ones wait for workout.purge in Routine.all_objects"""
+    def get_queryset(self):
+        return super(RoutineManager, self).get_queryset().filter(deleted_at__isnull=True)
 
 
 class UserProfile(models.Model, ModelMixin):
     user = models.OneToOneField(User, related_name='user_profile')
     user_type = models.CharField(max_length=30, choices=USER_TYPES, default='NORMAL')
+    # Watermark bumped whenever any of the user's routines, exercises or history change
+    data_changed_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return '{0}, {1}'.format(self.user.last_name, self.user.first_name)
@@ -36,11 +127,34 @@ class UserProfile(models.Model, ModelMixin):
     def add_routine(self, **kwargs):
         return self.routines.create(**kwargs)
 
+    @staticmethod
+    def touch(**filters):
+        """Bump data_changed_at for the profiles matching filters, in a single UPDATE"""
+        if filters:
+            UserProfile.objects.filter(**filters).update(data_changed_at=timezone.now())
+
+    @staticmethod
+    def get_data_changed_at(user_id=None, **filters):
+        """
+        The change watermark for an auth user id, or for the profile matching filters such as
+        routines=<id>, read without loading the profile
+        """
+        if user_id is not None:
+            filters['user_id'] = user_id
+        if not filters:
+            return None
+        return UserProfile.objects.filter(**filters).values_list('data_changed_at', flat=True).first()
+
 
 class Routine(models.Model, ModelMixin):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='routines', blank=True, null=True)
     name = models.CharField(max_length=255, default='Custom Routine')
     day = models.CharField(max_length=30, choices=DAYS_OF_WEEK, default='SUNDAY')
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)  # Soft deleted, waiting to be purged. See workout.purge
+
+    objects = RoutineManager()
+    all_objects = RoutineQuerySet.as_manager()
 
     def __str__(self):
         return '{0} -- {1}'.format(self.name, self.get_day_display())
@@ -49,9 +163,7 @@ class Routine(models.Model, ModelMixin):
         return 'Routine: {0} -- ID: {1}'.format(self.name, self.id)
 
     def __lt__(self, other):
-        self_index = DAYS_OF_WEEK.index((self.day, self.get_day_display()))
-        other_index = DAYS_OF_WEEK.index((other.day, other.get_day_display()))
-        return self_index < other_index
+        return DAY_ORDINALS[self.day] < DAY_ORDINALS[other.day]
 
     def __eq__(self, other):
         return self.day == other.day
@@ -68,12 +180,25 @@ class Exercise(models.Model, ModelMixin):
     priority = models.IntegerField(default=0)  # Order in which the exercise is performed
     exercise_type = models.CharField(max_length=30, choices=EXERCISE_TYPES, default='RESISTANCE')
     name = models.CharField(max_length=250, choices=EXERCISES, default='Custom Exercise')
-    sets = ArrayField(models.IntegerField(default=10), size=10, default=list())
+    sets = PackedIntegerArrayField(size=10, default=list)
     rest_duration = models.IntegerField(default=60)  # Time represented in seconds
+    updated_at = models.DateTimeField(auto_now=True)
+    # Summary of the history, kept current by the ExerciseHistory signal handlers so pages listing exercises
+    # don't query history. Written with queryset updates that leave updated_at alone; see rebuild_exercise_summaries
+    last_performed_at = models.DateTimeField(null=True, blank=True)
+    last_sets = PackedIntegerArrayField(size=10, default=list)
+    last_weights_per_set = PackedIntegerArrayField(size=10, default=list)
+    best_one_rep_max = models.FloatField(null=True, blank=True)  # Epley estimate
+    session_count = models.IntegerField(default=0)
 
     def __str__(self):
         return '{0} -- {1}'.format(self.get_exercise_type_display(), self.name)
 
+    @property
+    def last_session(self):
+        """(reps, weight) of each set last time the exercise was performed"""
+        return list(zip(self.last_sets, self.last_weights_per_set))
+
     def __lt__(self, other):
         return self.priority < other.priority
 
@@ -88,29 +213,116 @@ class Exercise(models.Model, ModelMixin):
             kwargs['sets'] = self.sets
         return self.history.create(**kwargs)
 
-    def get_history_by_day(self, date=timezone.now()):
+    @classmethod
+    def refresh_summary(cls, exercise_id):
+        """Recompute an exercise's history summary from all of its history"""
+        _, _, reps, weights = analytics.load_history(cls(pk=exercise_id))
+        last = ExerciseHistory.objects.filter(exercise_id=exercise_id).order_by('-timestamp', '-id').values_list(
+            'timestamp', 'sets', 'weights_per_set').first() or (None, [], [])
+        return cls.objects.filter(pk=exercise_id).update(
+            last_sets=last[1],
+            last_weights_per_set=last[2],
+            best_one_rep_max=analytics.best_one_rep_max(reps, weights),
+            session_count=len(reps),
+            last_performed_at=last[0],
+        )
+
+    @classmethod
+    def add_to_summary(cls, *histories):
+        """
+        Fold newly logged ExerciseHistory rows of one exercise into its summary with a single UPDATE,
+        without reading the rest of its history
+        """
+        history = max(reversed(histories), key=lambda x: x.timestamp)  # The latest, the last logged on ties
+        is_latest = models.Q(last_performed_at__isnull=True) | models.Q(last_performed_at__lte=history.timestamp)
+
+        def latest(name, value):
+            field = cls._meta.get_field(name)
+            return models.Case(models.When(is_latest, then=models.Value(value, output_field=field)),
+                               default=models.F(name), output_field=field)
+
+        estimates = [analytics.session_one_rep_max(x.sets, x.weights_per_set) for x in histories]
+        estimates = [x for x in estimates if x is not None]
+        changes = {
+            'session_count': models.F('session_count') + len(histories),
+            'last_sets': latest('last_sets', history.sets),
+            'last_weights_per_set': latest('last_weights_per_set', history.weights_per_set),
+            # Last, so backends that apply assignments in order still compare against the old timestamp
+            'last_performed_at': latest('last_performed_at', history.timestamp),
+        }
+        if estimates:
+            estimate = max(estimates)
+            changes['best_one_rep_max'] = models.Case(
+                models.When(best_one_rep_max__gte=estimate, then=models.F('best_one_rep_max')),
+                default=models.Value(estimate), output_field=models.FloatField())
+        return cls.objects.filter(pk=history.exercise_id).update(**changes)
+
+    def get_history_by_day(self, date=None, tz=None):
         """
         Get a list of ExerciseHistory objects for the date provided
 
-        :param datetime.datetime date: Day of history to filter by
+        :param datetime.date|datetime.datetime date: Day of history to filter by, defaults to today
+        :param tzinfo tz: Timezone the day is in, defaults to the current timezone
         :return list(ExerciseHistory):
         """
-        return self.history.filter(timestamp__year=date.year, timestamp__day=date.day)
+        start, end = date_windows.day_window(date, tz)
+        return self.history.filter(timestamp__gte=start, timestamp__lt=end)
+
+    def get_history_by_date_range(self, start_date=None, end_date=None, tz=None):
+        """
+        Get ExerciseHistory objects from the start of start_date through the end of end_date.
+        Defaults to the last week. Queried as a half-open [start, end) range so the
+        (exercise, timestamp) index can serve it.
+        """
+        start, end = date_windows.date_range_window(start_date, end_date, tz)
+        return self.history.filter(timestamp__gte=start, timestamp__lt=end)
+
+    def get_daily_volume(self, start_date=None, end_date=None, tz=None):
+        """
+        Get the precomputed ExerciseDailyVolume rows for the days between start_date and end_date, inclusive.
+        Reads one row per day rather than one per logged set.
+        """
+        start, end = date_windows.date_range_window(start_date, end_date, tz)
+        return self.daily_volume.filter(day__gte=date_windows.local_date(start, tz),
+                                        day__lt=date_windows.local_date(end, tz))
 
-    def get_history_by_date_range(self,
-                                  start_date=timezone.now() - datetime.timedelta(days=7),
-                                  end_date=timezone.now()):
-        start_date = start_date.replace(hour=0, minute=0)
-        end_date = end_date.replace(hour=23, minute=59)
-        return self.history.filter(timestamp__gte=start_date, timestamp__lte=end_date)
+    def get_weekly_volume(self, start_date, end_date):
+        """
+        Roll the daily volume rows up into weeks starting on Sunday, matching DAYS_OF_WEEK
+
+        :return list(dict):
+        """
+        weeks = []
+        for row in self.get_daily_volume(start_date, end_date):
+            week_start = row.day - datetime.timedelta(days=(row.day.weekday() + 1) % 7)
+            if not weeks or weeks[-1]['week'] != week_start:
+                weeks.append({
+                    'week': week_start,
+                    'total_reps': 0,
+                    'total_tonnage': 0,
+                    'set_count': 0,
+                    'max_weight': 0,
+                })
+            week = weeks[-1]
+            week['total_reps'] += row.total_reps
+            week['total_tonnage'] += row.total_tonnage
+            week['set_count'] += row.set_count
+            week['max_weight'] = max(week['max_weight'], row.max_weight)
+        return weeks
 
 
 class ExerciseHistory(models.Model, ModelMixin):
     exercise = models.ForeignKey(Exercise, related_name='history')
     timestamp = models.DateTimeField(default=timezone.now)
-    sets = ArrayField(models.IntegerField(default=10), size=10, default=list())
-    weights_per_set = ArrayField(models.IntegerField(default=10), size=10, default=list())
+    sets = PackedIntegerArrayField(size=10, default=list)
+    weights_per_set = PackedIntegerArrayField(size=10, default=list)
     notes = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [
+            ('exercise', 'timestamp', 'id'),  # Serves date ranges and (timestamp, id) keyset pagination
+        ]
 
     def json(self):
         return {
@@ -123,3 +335,246 @@ class ExerciseHistory(models.Model, ModelMixin):
 
     def get_absolute_url(self):
         return reverse('exercise_history_detail', kwargs={'history_id': self.id})
+
+
+class CardioSession(models.Model):
+    """Per-second samples of a CARDIO history entry, each series packed as one typed array. See workout.cardio"""
+    history = models.OneToOneField(ExerciseHistory, on_delete=models.CASCADE, related_name='cardio', primary_key=True)
+    interval = models.FloatField(default=1.0)  # Seconds between samples
+    sample_count = models.IntegerField(default=0)
+    heart_rate = models.BinaryField(null=True)
+    pace = models.BinaryField(null=True)
+    distance = models.BinaryField(null=True)
+
+    def get_series(self, name):
+        return cardio.unpack(name, getattr(self, name))
+
+    def summary(self):
+        """Duration, average heart rate, total distance and average pace of the session"""
+        data = {
+            'duration': self.sample_count * self.interval,
+        }
+        heart_rate = self.get_series('heart_rate')
+        heart_rate = heart_rate[cardio.present('heart_rate', heart_rate)]
+        data['average_heart_rate'] = round(float(heart_rate.mean()), 1) if len(heart_rate) else None
+        distance = self.get_series('distance')
+        distance = distance[cardio.present('distance', distance)]
+        data['distance'] = round(float(distance.max()), 1) if len(distance) else None
+        pace = self.get_series('pace')
+        pace = pace[cardio.present('pace', pace)]
+        data['average_pace'] = round(float(pace.mean()), 1) if len(pace) else None
+        return data
+
+
+def history_day(timestamp):
+    """The calendar day an ExerciseHistory timestamp is rolled up under"""
+    return date_windows.local_date(timestamp)
+
+
+class ExerciseDailyVolume(models.Model):
+    """Per exercise, per day totals of ExerciseHistory, kept current by the history save/delete signals"""
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='daily_volume')
+    day = models.DateField()
+    total_reps = models.IntegerField(default=0)
+    total_tonnage = models.BigIntegerField(default=0)  # Sum of reps * weight for every set
+    set_count = models.IntegerField(default=0)
+    max_weight = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ('exercise', 'day'),
+        ]
+        ordering = ['day']
+
+    def json(self):
+        return {
+            'day': self.day.isoformat(),
+            'total_reps': self.total_reps,
+            'total_tonnage': self.total_tonnage,
+            'set_count': self.set_count,
+            'max_weight': self.max_weight,
+        }
+
+    @staticmethod
+    def totals(histories):
+        """
+        Sum the volume of an iterable of ExerciseHistory objects
+
+        :return dict: Field values for an ExerciseDailyVolume row
+        """
+        totals = {
+            'total_reps': 0,
+            'total_tonnage': 0,
+            'set_count': 0,
+            'max_weight': 0,
+        }
+        for history in histories:
+            for reps, weight in zip(history.sets, history.weights_per_set):
+                totals['total_reps'] += reps
+                totals['total_tonnage'] += reps * weight
+                totals['set_count'] += 1
+                totals['max_weight'] = max(totals['max_weight'], weight)
+        return totals
+
+    @classmethod
+    def refresh(cls, exercise_id, day):
+        """Recompute the rollup row for one exercise and day from that day's history"""
+        start, end = date_windows.day_window(day)
+        histories = ExerciseHistory.objects.filter(
+            exercise_id=exercise_id,
+            timestamp__gte=start,
+            timestamp__lt=end,
+        ).only('sets', 'weights_per_set')
+        totals = cls.totals(histories)
+        if totals['set_count']:
+            cls.objects.update_or_create(exercise_id=exercise_id, day=day, defaults=totals)
+        else:
+            cls.objects.filter(exercise_id=exercise_id, day=day).delete()
+
+
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_workers`. See workout.jobs"""
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)  # Registered task name
+    # Deduplication key, unique among unfinished jobs. Cleared when the job finishes so it can be enqueued again
+    key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    payload = models.TextField(default='{}')  # JSON keyword arguments for the task
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [
+            ('status', 'run_at'),
+        ]
+
+    def __str__(self):
+        return '{0} -- {1} ({2})'.format(self.name, self.key or self.id, self.status)
+
+
+class ChangeLogEntry(models.Model):
+    """Append-only record of changes to a user's data, read by the delta sync endpoint. See workout.sync"""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = (
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    )
+
+    id = models.BigAutoField(primary_key=True)  # Doubles as the sync token
+    # No database constraint: deleting a profile cascades to its routines, whose delete signals log
+    # entries for the profile that is about to go, which would otherwise fail the FK check at commit
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='changes', db_constraint=False)
+    model = models.CharField(max_length=20)  # 'routine', 'exercise' or 'history'
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [
+            ('user', 'id'),
+            ('user', 'created_at'),  # The sync overlap window
+        ]
+
+
+def bulk_create_history(histories):
+    """
+    bulk_create ExerciseHistory objects and refresh the rollup days and exercise summaries they touch,
+    since bulk_create doesn't send the post_save signals that normally keep them current.
+    Call inside a transaction.
+
+    :return list: The objects, with their pks set on every backend
+    """
+    from .plan_cache import invalidate_weekly_plan
+    histories = list(histories)
+    returns_ids = connection.features.can_return_ids_from_bulk_insert
+    if not returns_ids:
+        last_id = ExerciseHistory.objects.aggregate(last_id=models.Max('id'))['last_id'] or 0
+    created = ExerciseHistory.objects.bulk_create(histories)
+    if not returns_ids:
+        # Rows are inserted in order, so re-read the new ids to log the rows for sync and return them
+        ids = list(ExerciseHistory.objects.filter(
+            id__gt=last_id, exercise_id__in=set(x.exercise_id for x in created)).order_by('id').values_list(
+            'id', flat=True))
+        if len(ids) == len(created):
+            for history, pk in zip(created, ids):
+                history.pk = pk
+    for exercise_id, day in set((x.exercise_id, history_day(x.timestamp)) for x in created):
+        ExerciseDailyVolume.refresh(exercise_id, day)
+    exercise_ids = set(x.exercise_id for x in created)
+    for exercise_id in exercise_ids:
+        Exercise.add_to_summary(*[x for x in created if x.exercise_id == exercise_id])
+    invalidate_weekly_plan(routine_ids=list(Exercise.objects.filter(pk__in=exercise_ids).values_list(
+        'routine_id', flat=True)))
+    UserProfile.touch(routines__exercises__in=exercise_ids)
+    if all(x.pk for x in created):
+        from .sync import record_changes
+        owners = dict(Exercise.objects.filter(pk__in=exercise_ids).values_list('id', 'routine__user_id'))
+        for profile_id in set(owners.values()):
+            ids = [x.pk for x in created if owners[x.exercise_id] == profile_id]
+            record_changes(profile_id, 'history', ids, ChangeLogEntry.CREATE)
+    return created
+
+
+@receiver(post_init, sender=ExerciseHistory)
+def remember_history_day(sender, instance, **kwargs):
+    # Remember where the row was rolled up so moving its timestamp also refreshes the old day.
+    # Read through __dict__: touching a deferred field would load it, firing post_init again
+    exercise_id, timestamp = instance.__dict__.get('exercise_id'), instance.__dict__.get('timestamp')
+    if exercise_id and timestamp:
+        instance._rollup_key = (exercise_id, history_day(timestamp))
+    else:
+        instance._rollup_key = None
+
+
+@receiver(post_save, sender=ExerciseHistory)
+def update_exercise_summary(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not set(update_fields) - {'notes', 'updated_at'}):
+        return
+    if created:
+        Exercise.add_to_summary(instance)
+    else:
+        Exercise.refresh_summary(instance.exercise_id)  # The edited row may have been the latest or the best
+
+
+@receiver(post_delete, sender=ExerciseHistory)
+def remove_from_exercise_summary(sender, instance, **kwargs):
+    Exercise.refresh_summary(instance.exercise_id)
+
+
+@receiver(post_save, sender=Routine)
+@receiver(post_delete, sender=Routine)
+def touch_routine_owner(sender, instance, raw=False, **kwargs):
+    if not raw and instance.user_id:
+        UserProfile.touch(pk=instance.user_id)
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def touch_exercise_owner(sender, instance, raw=False, **kwargs):
+    if not raw and instance.routine_id:
+        UserProfile.touch(routines=instance.routine_id)
+
+
+@receiver(post_save, sender=ExerciseHistory)
+@receiver(post_delete, sender=ExerciseHistory)
+def touch_history_owner(sender, instance, raw=False, **kwargs):
+    if not raw:
+        UserProfile.touch(routines__exercises=instance.exercise_id)
@@ -0,0 +1,60 @@
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+HISTORY_PAGE_SIZE = getattr(settings, 'WORKOUT_HISTORY_PAGE_SIZE', 50)
+MAX_HISTORY_PAGE_SIZE = getattr(settings, 'WORKOUT_MAX_HISTORY_PAGE_SIZE', 500)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque cursor pointing just after the row with this (timestamp, id)"""
+    value = '{}|{}'.format(timestamp.isoformat(), pk)
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if timestamp is None:
+        raise InvalidCursor(cursor)
+    return timestamp, pk
+
+
+def get_page_size(value, default=HISTORY_PAGE_SIZE):
+    try:
+        return min(max(int(value), 1), MAX_HISTORY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return default
+
+
+def paginate_by_keyset(queryset, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Get one page of a queryset ordered by (timestamp, id). Each page is a seek on the
+    (exercise, timestamp, id) index, so deep pages cost the same as the first one.
+
+    :param QuerySet queryset: ExerciseHistory queryset, of instances or of .values() dicts
+    :param str cursor: The `next` value of the previous page, or None for the first page
+    :param int page_size:
+    :return tuple: (list of rows, next cursor or None)
+    """
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+    rows = list(queryset.order_by('timestamp', 'id')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last['timestamp'], last['id'])
+    return rows, encode_cursor(last.timestamp, last.id)
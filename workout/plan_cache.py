@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .constants import DAYS_OF_WEEK
+from .models import Routine, Exercise, ExerciseHistory, UserProfile
+
+PLAN_CACHE_TIMEOUT = getattr(settings, 'WORKOUT_PLAN_CACHE_TIMEOUT', 60 * 60 * 24)
+ROUTINE_FIELDS = ('id', 'name', 'day')
+EXERCISE_FIELDS = ('id', 'routine_id', 'priority', 'exercise_type', 'name', 'sets', 'rest_duration',
+                   'last_performed_at', 'last_sets', 'last_weights_per_set', 'best_one_rep_max', 'session_count')
+DAY_NAMES = dict(DAYS_OF_WEEK)
+
+
+def plan_cache_key(user_id):
+    return 'workout:weekly-plan:{}'.format(user_id)
+
+
+def build_plan(routines):
+    """
+    Plain dicts of routines and their exercises, which pickle smaller and faster than model instances
+    and don't go stale when a model changes
+
+    :param QuerySet routines: Routines in the order to list them
+    :return list(dict): Each routine's ROUTINE_FIELDS plus `day_display`, and `exercises` in priority order,
+        each with its EXERCISE_FIELDS plus `last_session`
+    """
+    plan = list(routines.values(*ROUTINE_FIELDS))
+    exercises = {x['id']: [] for x in plan}
+    for exercise in Exercise.objects.using(routines.db).filter(routine_id__in=exercises).order_by(
+            'priority', 'id').values(*EXERCISE_FIELDS):
+        exercise['last_session'] = list(zip(exercise['last_sets'], exercise['last_weights_per_set']))
+        exercises[exercise['routine_id']].append(exercise)
+    for routine in plan:
+        routine['day_display'] = DAY_NAMES.get(routine['day'], routine['day'])
+        routine['exercises'] = exercises[routine['id']]
+    return plan
+
+
+def get_weekly_plan(user_id):
+    """
+    Get the user's routines ordered by day, each with its exercises in priority order, as built by build_plan.
+    Served from the cache framework and rebuilt on a miss.
+
+    :param int user_id: Id of the auth User, so no UserProfile lookup is needed on a hit
+    :return list(dict):
+    """
+    if user_id is None:
+        return []
+    key = plan_cache_key(user_id)
+    plan = cache.get(key)
+    if plan is None:
+        # Always rebuilt from the primary, a lagging replica would otherwise be cached until the next change
+        plan = build_plan(Routine.objects.using('default').filter(user__user_id=user_id).ordered_by_day())
+        cache.set(key, plan, PLAN_CACHE_TIMEOUT)
+    return plan
+
+
+def invalidate_weekly_plan(profile_ids=None, routine_ids=None, user_ids=None):
+    """
+    Drop the cached plans for the given users, or the owners of the given profiles or routines.
+    Safe inside a transaction: the plans are dropped now and again once it commits, in case another
+    request cached the old rows in between.
+    """
+    user_ids = set(user_ids or [])
+    if profile_ids:
+        user_ids.update(UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+    if routine_ids:
+        user_ids.update(UserProfile.objects.filter(routines__in=routine_ids).values_list('user_id', flat=True))
+    keys = [plan_cache_key(x) for x in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# ModelMixin.update goes through save(), so these cover it as well as direct saves and deletes.
+# Queryset update()/delete() bypass signals and must call invalidate_weekly_plan themselves.
+@receiver(post_save, sender=Routine)
+@receiver(post_delete, sender=Routine)
+def invalidate_routine_plan(sender, instance, raw=False, **kwargs):
+    if not raw and instance.user_id:
+        invalidate_weekly_plan(profile_ids=[instance.user_id])
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def invalidate_exercise_plan(sender, instance, raw=False, **kwargs):
+    if not raw and instance.routine_id:
+        invalidate_weekly_plan(routine_ids=[instance.routine_id])
+
+
+@receiver(post_save, sender=ExerciseHistory)
+@receiver(post_delete, sender=ExerciseHistory)
+def invalidate_history_plan(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Cached exercises carry their history summary, which every history change except a notes edit updates
+    if raw or (update_fields and not set(update_fields) - {'notes', 'updated_at'}):
+        return
+    invalidate_weekly_plan(routine_ids=list(Exercise.objects.filter(pk=instance.exercise_id).values_list(
+        'routine_id', flat=True)))
@@ -0,0 +1,165 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware records wall time, SQL time and query count (with duplicate detection),
+template render time and, optionally, traced memory for each request, and aggregates them per URL name.
+
+Enable it for every request with WORKOUT_PROFILING = True, or let staff profile a single request
+with the X-Pyfit-Profile header when WORKOUT_PROFILING_HEADER = True. With both off the middleware
+removes itself at startup and costs nothing. WORKOUT_PROFILING_MEMORY = True also starts tracemalloc
+once at startup, which slows down every request while it traces, and records how much traced memory
+each profiled request grew by (its peak growth on Python 3.9+, which can reset the peak).
+"""
+import collections
+import math
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+PROFILE_HEADER = 'HTTP_X_PYFIT_PROFILE'
+MAX_SAMPLES = getattr(settings, 'WORKOUT_PROFILING_MAX_SAMPLES', 1000)  # Per URL name
+
+
+class ProfileStore(object):
+    """Thread safe, in-process ring buffer of request profiles per URL name"""
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.max_samples))
+
+    def add(self, url_name, sample):
+        with self.lock:
+            self.samples[url_name].append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        """
+        Percentiles of every recorded metric per URL name
+
+        :return dict: {url_name: {'count': int, metric: {'p50': .., 'p95': .., 'p99': .., 'max': ..}}}
+        """
+        with self.lock:
+            samples = {k: list(v) for k, v in self.samples.items()}
+        summary = {}
+        for url_name, rows in samples.items():
+            summary[url_name] = {'count': len(rows)}
+            for metric in ('wall_ms', 'sql_ms', 'queries', 'duplicate_queries', 'render_ms', 'memory_kb'):
+                summary[url_name][metric] = percentiles([x[metric] for x in rows if x[metric] is not None])
+        return summary
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Nearest-rank percentiles of a list of numbers"""
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {'p{}'.format(x): values[max(0, int(math.ceil(x / 100.0 * len(values))) - 1)] for x in points}
+    result['max'] = values[-1]
+    return result
+
+
+store = ProfileStore()
+
+
+class QueryRecorder(collections.deque):
+    """
+    Stands in for a connection's bounded queries_log while a request is profiled, counting every
+    query appended to it even after the oldest entries have fallen out of the log
+    """
+    def __init__(self, maxlen):
+        super(QueryRecorder, self).__init__(maxlen=maxlen)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_counts = collections.Counter()
+
+    def append(self, query):
+        super(QueryRecorder, self).append(query)
+        self.count += 1
+        self.seconds += float(query['time'])
+        self.sql_counts[query['sql']] += 1
+
+
+class ProfilingMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.always = getattr(settings, 'WORKOUT_PROFILING', False)
+        self.allow_header = getattr(settings, 'WORKOUT_PROFILING_HEADER', False)
+        if not self.always and not self.allow_header:
+            raise MiddlewareNotUsed()
+        self.trace_memory = getattr(settings, 'WORKOUT_PROFILING_MEMORY', False)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def should_profile(self, request):
+        if self.always:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(request.META.get(PROFILE_HEADER)) and user is not None and user.is_staff
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        request._profile_render_seconds = 0.0
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        # Test mirrors can share one connection object between aliases, so record each only once
+        recorded = []
+        for conn in {id(x): x for x in connections.all()}.values():
+            recorded.append((conn, conn.force_debug_cursor, conn.queries_log))
+            conn.force_debug_cursor = True
+            conn.queries_log = QueryRecorder(conn.queries_log.maxlen)
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            wall = time.perf_counter() - start
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                memory_end = peak if hasattr(tracemalloc, 'reset_peak') else current
+            query_count, sql_seconds, sql_counts = 0, 0.0, collections.Counter()
+            for conn, force_debug_cursor, queries_log in recorded:
+                conn.force_debug_cursor = force_debug_cursor
+                recorder, conn.queries_log = conn.queries_log, queries_log
+                queries_log.extend(recorder)
+                query_count += recorder.count
+                sql_seconds += recorder.seconds
+                sql_counts.update(recorder.sql_counts)
+
+        sample = {
+            'wall_ms': round(wall * 1000, 3),
+            'sql_ms': round(sql_seconds * 1000, 3),
+            'queries': query_count,
+            'duplicate_queries': sum(x - 1 for x in sql_counts.values()),
+            'render_ms': round(request._profile_render_seconds * 1000, 3),
+            'memory_kb': round(max(memory_end - memory_start, 0) / 1024.0, 1) if tracing else None,
+        }
+        match = getattr(request, 'resolver_match', None)
+        store.add(match.url_name if match and match.url_name else request.path, sample)
+        response['Server-Timing'] = 'app;dur={wall_ms}, sql;dur={sql_ms}, render;dur={render_ms}'.format(**sample)
+        return response
+
+    def process_template_response(self, request, response):
+        if not hasattr(request, '_profile_render_seconds'):
+            return response
+        render = response.render
+
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request._profile_render_seconds += time.perf_counter() - start
+        response.render = timed_render
+        return response
@@ -0,0 +1,125 @@
+"""
+Deleting routines without one huge cascading transaction.
+
+Routine.delete() has Django's collector load every exercise and history row under the routine
+before deleting them, all in one transaction. Instead, soft_delete_routine detaches the routine
+from its owner right away, which hides it and everything under it from every user-scoped query.
+The purge_routine job then removes the history in bounded batches of raw set-based DELETEs. Each
+batch is its own job, and so its own short transaction, and it re-enqueues itself until the
+exercises and the routine itself can go.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import (CardioSession,
+                     ChangeLogEntry,
+                     Exercise,
+                     ExerciseDailyVolume,
+                     ExerciseHistory,
+                     Routine,
+                     UserProfile,
+                     )
+from .plan_cache import invalidate_weekly_plan
+from .sync import record_changes
+
+PURGE_BATCH_SIZE = getattr(settings, 'WORKOUT_PURGE_BATCH_SIZE', 5000)
+
+
+def soft_delete_routine(routine):
+    """Hide a routine from its owner and queue the purge of it and everything under it"""
+    with transaction.atomic():
+        if routine.user_id:
+            record_changes(routine.user_id, 'routine', [routine.id], ChangeLogEntry.DELETE)
+            record_changes(routine.user_id, 'exercise', routine.exercises.values_list('id', flat=True),
+                           ChangeLogEntry.DELETE)
+        # Detaching the owner takes the routine's rows out of every routine__user query as well
+        Routine.all_objects.filter(pk=routine.pk).update(deleted_at=timezone.now(), user=None)
+        if routine.user_id:
+            invalidate_weekly_plan(profile_ids=[routine.user_id])
+            UserProfile.touch(pk=routine.user_id)
+        enqueue_purge(routine.pk)
+
+
+def enqueue_purge(routine_id, batch_size=PURGE_BATCH_SIZE):
+    return enqueue('purge_routine', key='purge-routine:{}'.format(routine_id), routine_id=routine_id,
+                   batch_size=batch_size)
+
+
+def raw_delete(model, column, ids):
+    """
+    DELETE FROM model's table WHERE column IN (the ids queryset's SQL), as a single statement.
+    Skips Django's collector: nothing is loaded, no signals are sent and nothing cascades.
+
+    :return int: Rows deleted
+    """
+    subquery, params = ids.query.sql_with_params()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(qn(model._meta.db_table), qn(column), subquery),
+                       params)
+        return cursor.rowcount
+
+
+def delete_exercises(exercise_ids):
+    """
+    Delete exercises with their history, cardio samples and rollups in four set-based DELETEs.
+    Unlike QuerySet.delete(), no history is loaded and no per-row signals are sent, so the caller
+    logs the deletes for sync, invalidates the weekly plans and touches the owners once.
+    Call inside a transaction.
+
+    :param QuerySet exercise_ids: Exercise.objects...values('id')
+    :return int: Exercises deleted
+    """
+    history = ExerciseHistory.objects.filter(exercise_id__in=exercise_ids)
+    raw_delete(CardioSession, 'history_id', history.values('id'))
+    raw_delete(ExerciseHistory, 'exercise_id', exercise_ids)
+    raw_delete(ExerciseDailyVolume, 'exercise_id', exercise_ids)
+    return raw_delete(Exercise, 'id', exercise_ids)
+
+
+def purge_batch(routine_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete the oldest batch_size history rows of a soft-deleted routine. Once there are none left,
+    delete its rollups, exercises and the routine itself. Call inside a transaction.
+
+    :return dict: {'deleted': history rows deleted, 'remaining': history rows left, 'done': routine is gone}
+    """
+    if not Routine.all_objects.filter(pk=routine_id, deleted_at__isnull=False).exists():
+        return {'deleted': 0, 'remaining': 0, 'done': True}
+    exercise_ids = Exercise.objects.filter(routine_id=routine_id).values('id')
+    history = ExerciseHistory.objects.filter(exercise_id__in=exercise_ids)
+    # Bound the batch by id so the same rows are picked for the cardio samples and the history
+    boundary = history.order_by('id').values_list('id', flat=True)[batch_size - 1:batch_size].first()
+    if boundary is not None:
+        history = history.filter(id__lte=boundary)
+
+    raw_delete(CardioSession, 'history_id', history.values('id'))
+    deleted = raw_delete(ExerciseHistory, 'id', history.values('id'))
+    if boundary is not None:
+        remaining = ExerciseHistory.objects.filter(exercise_id__in=exercise_ids).count()
+        return {'deleted': deleted, 'remaining': remaining, 'done': False}
+
+    raw_delete(ExerciseDailyVolume, 'exercise_id', exercise_ids)
+    raw_delete(Exercise, 'id', exercise_ids)
+    raw_delete(Routine, 'id', Routine.all_objects.filter(pk=routine_id).values('id'))
+    return {'deleted': deleted, 'remaining': 0, 'done': True}
+
+
+def purge_routine(routine_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """
+    Purge a soft-deleted routine a batch per transaction, instead of through the job queue
+
+    :param callable progress: Called with purge_batch's result after every batch
+    :return int: History rows deleted
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            result = purge_batch(routine_id, batch_size)
+        total += result['deleted']
+        if progress:
+            progress(result)
+        if result['done']:
+            return total
@@ -0,0 +1,57 @@
+"""
+Read-only serializers for the REST API.
+
+They serialize the dicts returned by QuerySet.values() rather than model instances, and
+trim themselves to the fields requested with ?fields= so the query projects only those columns.
+"""
+from rest_framework import serializers
+
+
+class ValuesSerializer(serializers.Serializer):
+    """
+    Serializer for .values() rows. Pass `fields` to keep only some of the declared fields;
+    `get_values_fields` gives the matching column names for the queryset projection.
+    """
+    required_fields = ('id',)
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(ValuesSerializer, self).__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields) - set(self.required_fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_values_fields(cls, requested=None):
+        """Declared fields that were requested (all of them when nothing is), in declaration order"""
+        declared = list(cls._declared_fields)
+        if not requested:
+            return declared
+        return [x for x in declared if x in requested or x in cls.required_fields]
+
+
+class RoutineSerializer(ValuesSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    day = serializers.CharField()
+
+
+class ExerciseSerializer(ValuesSerializer):
+    id = serializers.IntegerField()
+    routine_id = serializers.IntegerField()
+    priority = serializers.IntegerField()
+    exercise_type = serializers.CharField()
+    name = serializers.CharField()
+    sets = serializers.ListField(child=serializers.IntegerField())
+    rest_duration = serializers.IntegerField()
+
+
+class ExerciseHistorySerializer(ValuesSerializer):
+    required_fields = ('id', 'timestamp')  # The keyset pagination cursor is built from these
+
+    id = serializers.IntegerField()
+    exercise_id = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+    sets = serializers.ListField(child=serializers.IntegerField())
+    weights_per_set = serializers.ListField(child=serializers.IntegerField())
+    notes = serializers.CharField()
@@ -0,0 +1,107 @@
+"""
+Delta sync for offline-first clients.
+
+Every create, update and delete of a Routine, Exercise or ExerciseHistory appends a ChangeLogEntry
+for its owner. A client keeps the `next` token from its last sync and asks for what changed since;
+changes are collapsed per object, and current rows are fetched in one query per model, so a sync
+costs O(changes) rather than O(data). A full sync replays the whole log, so anything written with
+bulk_create, which sends no signals, must be logged with record_changes; migration 0021 logged the
+rows that existed before the log did.
+
+Entry ids come from a sequence when they are inserted, not when their transaction commits, so an
+entry can become visible after a sync has already handed out a later id as its token. Each sync
+therefore also re-reads the entries at or below its token from the last SYNC_OVERLAP seconds,
+which may send a client some changes twice; applying a change is idempotent.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ChangeLogEntry, Exercise, ExerciseHistory, Routine
+
+SYNC_MODELS = {
+    'routine': (Routine, ('id', 'name', 'day')),
+    'exercise': (Exercise, ('id', 'routine_id', 'priority', 'exercise_type', 'name', 'sets', 'rest_duration')),
+    'history': (ExerciseHistory, ('id', 'exercise_id', 'timestamp', 'sets', 'weights_per_set', 'notes')),
+}
+MODEL_NAMES = {model: name for name, (model, _) in SYNC_MODELS.items()}
+MAX_SYNC_CHANGES = 1000
+# Longer than any transaction that logs changes is expected to stay open
+SYNC_OVERLAP = datetime.timedelta(seconds=getattr(settings, 'WORKOUT_SYNC_OVERLAP_SECONDS', 60))
+
+
+def owner_profile_id(instance):
+    if isinstance(instance, Routine):
+        return instance.user_id
+    if isinstance(instance, Exercise):
+        return Routine.objects.filter(pk=instance.routine_id).values_list('user_id', flat=True).first()
+    return Exercise.objects.filter(pk=instance.exercise_id).values_list('routine__user_id', flat=True).first()
+
+
+def record_changes(profile_id, model_name, ids, action):
+    """Log the same action for many objects of one owner with a single INSERT"""
+    if profile_id is None:
+        return
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(user_id=profile_id, model=model_name, object_id=x, action=action) for x in ids if x is not None
+    ])
+
+
+@receiver(post_save, sender=Routine)
+@receiver(post_save, sender=Exercise)
+@receiver(post_save, sender=ExerciseHistory)
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    action = ChangeLogEntry.CREATE if created else ChangeLogEntry.UPDATE
+    record_changes(owner_profile_id(instance), MODEL_NAMES[sender], [instance.pk], action)
+
+
+@receiver(post_delete, sender=Routine)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_delete, sender=ExerciseHistory)
+def record_delete(sender, instance, **kwargs):
+    record_changes(owner_profile_id(instance), MODEL_NAMES[sender], [instance.pk], ChangeLogEntry.DELETE)
+
+
+def changes_since(user_id, since=0, limit=MAX_SYNC_CHANGES):
+    """
+    Everything that changed for a user after the token `since`
+
+    :param int user_id: auth User id
+    :param int since: `next` from the previous sync, 0 for everything ever logged
+    :param int limit: Maximum log entries to read. When there are more, `more` is true and the client syncs again
+    :return dict: {'next': token, 'more': bool, 'upserts': {model: [rows]}, 'deletes': {model: [ids]}}
+    """
+    log = ChangeLogEntry.objects.filter(user__user_id=user_id).order_by('id').values_list(
+        'id', 'model', 'object_id', 'action')
+    entries = list(log.filter(id__gt=since)[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+    # Entries committed late, below ids already handed out. Kept out of `next` so paging always moves forward
+    overlap = list(log.filter(id__lte=since, created_at__gte=timezone.now() - SYNC_OVERLAP)[:limit]) if since else []
+
+    latest = {}  # (model, object_id) -> last action, so an object edited 50 times is sent once
+    for _, model_name, object_id, action in overlap + entries:
+        latest[(model_name, object_id)] = action
+
+    upserts, deletes = {}, {}
+    for name, (model, fields) in SYNC_MODELS.items():
+        deleted = [pk for (m, pk), action in latest.items() if m == name and action == ChangeLogEntry.DELETE]
+        changed = set(pk for (m, pk), action in latest.items() if m == name and action != ChangeLogEntry.DELETE)
+        rows = list(model.objects.filter(pk__in=changed).values(*fields)) if changed else []
+        # Changed objects that are gone by now were deleted in a later entry we haven't read yet
+        deleted.extend(changed - set(x['id'] for x in rows))
+        if rows:
+            upserts[name] = rows
+        if deleted:
+            deletes[name] = sorted(deleted)
+    return {
+        'next': str(entries[-1][0] if entries else since),
+        'more': more,
+        'upserts': upserts,
+        'deletes': deletes,
+    }
@@ -0,0 +1,94 @@
+"""
+Synthetic workout data for benchmarks: users with weekly routines and years of ExerciseHistory.
+
+Each exercise is logged once a week on its routine's day, with a few skipped weeks, 3-5 sets of
+roughly normally distributed reps, and a working weight that drifts upward with noise and deloads.
+"""
+import datetime
+import os
+import random
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import DAYS_OF_WEEK, DAY_ORDINALS, EXERCISES
+from .models import ChangeLogEntry, Exercise, ExerciseHistory, Routine
+from .sync import record_changes
+
+USERNAME_TEMPLATE = 'synthetic-{}@pyfit.local'
+PASSWORD = 'password'
+
+
+def generate(users=10, routines_per_user=3, exercises_per_routine=5, years=2, seed=0, batch_size=5000):
+    """
+    Create synthetic users, routines, exercises and history
+
+    :return dict: Number of rows created per model
+    """
+    rng = random.Random(seed)
+    created = {'users': 0, 'routines': 0, 'exercises': 0, 'history': 0}
+    today = timezone.now().replace(hour=18, minute=0, second=0, microsecond=0)
+    weeks = int(years * 52)
+    offset = User.objects.filter(username__startswith='synthetic-').count()
+
+    for user_index in range(offset, offset + users):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username=USERNAME_TEMPLATE.format(user_index),
+                email=USERNAME_TEMPLATE.format(user_index),
+                password=PASSWORD,
+                first_name='Synthetic',
+                last_name=str(user_index),
+            )
+            created['users'] += 1
+            days = rng.sample([x[0] for x in DAYS_OF_WEEK], min(routines_per_user, len(DAYS_OF_WEEK)))
+            batch, exercise_ids = [], []
+            for day in days:
+                routine = Routine.objects.create(user=user.user_profile, name='{} Routine'.format(day.title()), day=day)
+                created['routines'] += 1
+                for priority in range(exercises_per_routine):
+                    exercise = Exercise.objects.create(
+                        routine=routine,
+                        priority=priority,
+                        name=rng.choice(EXERCISES)[0],
+                        sets=[rng.choice((5, 8, 10, 12))] * rng.randint(3, 5),
+                    )
+                    created['exercises'] += 1
+                    exercise_ids.append(exercise.id)
+                    for history in exercise_history(rng, exercise, day, today, weeks):
+                        batch.append(history)
+                        if len(batch) >= batch_size:
+                            created['history'] += len(ExerciseHistory.objects.bulk_create(batch))
+                            batch = []
+            created['history'] += len(ExerciseHistory.objects.bulk_create(batch))
+            # bulk_create sends no signals, so log the history for sync here
+            record_changes(user.user_profile.id, 'history', ExerciseHistory.objects.filter(
+                exercise_id__in=exercise_ids).values_list('id', flat=True), ChangeLogEntry.CREATE)
+            # One rebuild per user is far cheaper than refreshing the rollups and summaries row by row
+            call_command('rebuild_daily_volume', exercise_ids=exercise_ids, stdout=open(os.devnull, 'w'))
+            call_command('rebuild_exercise_summaries', exercise_ids=exercise_ids, stdout=open(os.devnull, 'w'))
+    return created
+
+
+def exercise_history(rng, exercise, day, today, weeks):
+    """Yield unsaved weekly ExerciseHistory for an exercise, oldest first"""
+    days_back = (today.weekday() + 1) % 7 - DAY_ORDINALS[day]  # DAYS_OF_WEEK starts on Sunday
+    last_session = today - datetime.timedelta(days=days_back % 7)
+    weight = rng.randint(45, 135)
+    target_reps = exercise.sets[0]
+    for week in range(weeks, 0, -1):
+        weight += rng.choice((0, 0, 5, 5, 10))
+        if week % 12 == 0:
+            weight = int(weight * 0.9)  # Deload
+        if rng.random() < 0.1:
+            continue  # Missed session
+        sets = [max(1, int(rng.gauss(target_reps, 1.5))) for _ in exercise.sets[:10]]
+        yield ExerciseHistory(
+            exercise_id=exercise.id,
+            timestamp=last_session - datetime.timedelta(weeks=week - 1, minutes=rng.randint(0, 120)),
+            sets=sets,
+            weights_per_set=[weight] * len(sets),
+            notes='',
+        )
@@ -0,0 +1,62 @@
+"""Background tasks for workout.jobs and the signal handlers that enqueue them"""
+import logging
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+
+from . import purge
+from .jobs import enqueue, task
+from .models import ExerciseDailyVolume, ExerciseHistory, UserProfile, history_day
+
+logger = logging.getLogger(__name__)
+
+
+@task('refresh_daily_volume')
+def refresh_daily_volume(exercise_id, day):
+    ExerciseDailyVolume.refresh(exercise_id, parse_date(day))
+    # Responses embedding the rollup are cached against the watermark, which the history save bumped before this ran
+    UserProfile.touch(routines__exercises=exercise_id)
+
+
+@task('rebuild_daily_volume')
+def rebuild_daily_volume(exercise_ids=None):
+    from django.core.management import call_command
+    call_command('rebuild_daily_volume', exercise_ids=exercise_ids)
+    if exercise_ids:
+        UserProfile.touch(routines__exercises__in=exercise_ids)
+    else:
+        UserProfile.touch(pk__isnull=False)
+
+
+@task('purge_routine')
+def purge_routine(routine_id, batch_size=purge.PURGE_BATCH_SIZE):
+    # One batch per job, so each runs in its own short transaction, then queue the next
+    result = purge.purge_batch(routine_id, batch_size)
+    if result['done']:
+        logger.info('Purged routine %s', routine_id)
+    else:
+        logger.info('Purged %s history rows of routine %s, %s remaining', result['deleted'], routine_id,
+                    result['remaining'])
+        purge.enqueue_purge(routine_id, batch_size)
+
+
+def enqueue_daily_volume_refresh(exercise_id, day):
+    return enqueue('refresh_daily_volume', key='daily-volume:{}:{}'.format(exercise_id, day.isoformat()),
+                   exercise_id=exercise_id, day=day)
+
+
+@receiver(post_save, sender=ExerciseHistory)
+def update_daily_volume(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not set(update_fields) - {'notes', 'updated_at'}):
+        return
+    key = (instance.exercise_id, history_day(instance.timestamp))
+    enqueue_daily_volume_refresh(*key)
+    if instance._rollup_key and instance._rollup_key != key:
+        enqueue_daily_volume_refresh(*instance._rollup_key)
+    instance._rollup_key = key
+
+
+@receiver(post_delete, sender=ExerciseHistory)
+def remove_daily_volume(sender, instance, **kwargs):
+    enqueue_daily_volume_refresh(instance.exercise_id, history_day(instance.timestamp))
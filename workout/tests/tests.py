@@ -1,7 +1,45 @@
+import collections
 import datetime
-from django.test import TestCase, Client
+import importlib
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+from unittest import mock
 
-from workout.models import UserProfile, Routine, Exercise, ExerciseHistory
+import numpy as np
+import pytz
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import exceptions
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models.signals import post_init
+from django.db.utils import load_backend
+from django.test import TestCase, SimpleTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from pyfit import routers
+from pyfit.database import caches_from_env, databases_from_env
+from workout import (analytics, cardio, dashboard, date_windows, fields, jobs, plan_cache, profiling, purge, sync,
+                     synthetic, views as workout_views)
+from workout.urls import urlpatterns
+from workout.models import (UserProfile,
+                            Routine,
+                            Exercise,
+                            ExerciseHistory,
+                            ExerciseDailyVolume,
+                            Job,
+                            ChangeLogEntry,
+                            CardioSession,
+                            bulk_create_history,
+                            bulk_update_fields,
+                            )
 
 from .test_utils import *
 
@@ -37,6 +75,7 @@ class TestRoutines(TestCase, TestMixin):
     def setUp(self):
         self.client = Client()
         self.user = create_user()
+        cache.clear()
 
     def test_create_routine(self):
         login_user(self.client)
@@ -57,6 +96,128 @@ class TestRoutines(TestCase, TestMixin):
         res = self.client.get('/routines/')
         self.assertEqual(len(res.context['routines']), 3)
 
+    def test_routine_list_order(self):
+        login_user(self.client)
+        for day in ('SATURDAY', 'MONDAY', 'SUNDAY', 'WEDNESDAY'):
+            self.user.user_profile.add_routine(day=day)
+        res = self.client.get('/routines/')
+        self.assertEqual([x['day'] for x in res.context['routines']], ['SUNDAY', 'MONDAY', 'WEDNESDAY', 'SATURDAY'])
+
+    def test_routine_views_query_budget(self):
+        login_user(self.client)
+        for day in ('MONDAY', 'WEDNESDAY', 'FRIDAY'):
+            routine = self.user.user_profile.add_routine(day=day)
+            for priority in (3, 1, 2):
+                routine.add_exercise(priority=priority)
+
+        # Session, user, change watermark, routines and one prefetch for every routine's exercises
+        with self.assertNumQueries(5):
+            self.client.get('/routines/')
+
+        # The weekly plan is cached now, so only the session, user and watermark are loaded
+        with self.assertNumQueries(3):
+            self.client.get('/routines/')
+        with self.assertNumQueries(3):
+            res = self.client.get('/routine/{}/'.format(routine.id))
+        self.assertEqual([x['priority'] for x in res.context['exercises']], [1, 2, 3])
+
+    def test_weekly_plan_invalidation(self):
+        login_user(self.client)
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.client.get('/routines/')
+
+        routine.update(name='Pull')
+        res = self.client.get('/routines/')
+        self.assertEqual(res.context['routines'][0]['name'], 'Pull')
+
+        exercise = routine.add_exercise(name='BENCH_PRESS')
+        res = self.client.get('/routine/{}/'.format(routine.id))
+        self.assertEqual([x['id'] for x in res.context['exercises']], [exercise.id])
+
+        exercise.delete()
+        res = self.client.get('/routine/{}/'.format(routine.id))
+        self.assertEqual(len(res.context['exercises']), 0)
+
+    def test_weekly_plan_dropped_again_on_commit(self):
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        with mock.patch.object(plan_cache.transaction, 'on_commit') as on_commit:
+            routine.update(name='Pull')
+        plan_cache.get_weekly_plan(self.user.id)  # Cached by another request before the commit
+        self.assertTrue(on_commit.called)
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        self.assertIsNone(cache.get(plan_cache.plan_cache_key(self.user.id)))
+
+    def test_conditional_get(self):
+        login_user(self.client)
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        res = self.client.get('/routines/')
+        etag = res['ETag']
+        self.assertTrue(res.has_header('Last-Modified'))
+
+        # Unchanged data is answered from the watermark alone
+        with self.assertNumQueries(3):
+            res = self.client.get('/routines/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+        exercise = routine.add_exercise()
+        res = self.client.get('/routines/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        etag = res['ETag']
+
+        exercise.add_history(sets=[5], weights_per_set=[100])
+        self.assertEqual(self.client.get('/routines/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified_moves_with_the_day(self):
+        login_user(self.client)
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        UserProfile.objects.update(data_changed_at=yesterday)
+        since = http_date((yesterday + datetime.timedelta(minutes=1)).timestamp())
+        res = self.client.get('/routines/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(res.status_code, 200)  # Today's midnight is later than the watermark
+        res = self.client.get('/routines/', HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, 304)
+
+    def test_detail_pages_use_the_owners_watermark(self):
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        User.objects.create_user(username='other', password='password')
+        self.client.login(username='other', password='password')
+        etag = self.client.get('/routine/{}/'.format(routine.id))['ETag']
+        routine.update(name='Pull')  # Bumps the owner's watermark, not the requester's
+        res = self.client.get('/routine/{}/'.format(routine.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(res, 'Pull')
+
+    def test_updated_at(self):
+        routine = self.user.user_profile.add_routine()
+        updated_at = routine.updated_at
+        routine.update(name='Renamed')
+        routine.refresh_from_db()
+        self.assertGreater(routine.updated_at, updated_at)
+
+    def test_update_writes_only_dirty_fields(self):
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        with self.assertNumQueries(0):
+            self.assertFalse(routine.update(name='Push', day='MONDAY'))
+
+        routine.name = 'Pull'
+        self.assertEqual(routine.get_dirty_fields(), ['name'])
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(routine.save_dirty())
+        update = [x['sql'] for x in context.captured_queries if x['sql'].startswith('UPDATE "workout_routine"')]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"day"', update[0])
+        self.assertEqual(routine.get_dirty_fields(), [])
+
+    def test_dirty_array_fields(self):
+        exercise = Exercise.objects.create(sets=[5, 5])
+        exercise.sets.append(5)  # In place changes are caught too
+        self.assertEqual(exercise.get_dirty_fields(), ['sets'])
+
+    def test_snapshots_only_for_mixin_models(self):
+        self.assertTrue(post_init.has_listeners(Routine))
+        self.assertFalse(post_init.has_listeners(Job))
+        self.assertFalse(hasattr(Job(), '_loaded_values'))
+
     def test_delete_routine(self):
         login_user(self.client)
         routine = Routine.objects.create()
@@ -190,6 +351,101 @@ class TestExerciseHistory(TestCase, TestMixin):
         end_date = datetime.datetime.strptime('2017-01-15', '%Y-%m-%d')
         self.assertEqual(exercise.get_history_by_date_range(start_date, end_date).count(), 23)
 
+    def test_exercise_history_day_boundaries(self):
+        exercise = Exercise.objects.create()
+        day = datetime.datetime.strptime('2017-02-03', '%Y-%m-%d')
+        exercise.add_history(timestamp=day)
+        exercise.add_history(timestamp=day + datetime.timedelta(hours=23, minutes=59, seconds=59))
+        exercise.add_history(timestamp=day + datetime.timedelta(days=1))
+        exercise.add_history(timestamp=day.replace(month=3))  # Same year and day, different month
+
+        self.assertEqual(exercise.get_history_by_day(day).count(), 2)
+        self.assertEqual(exercise.get_history_by_date_range(day, day).count(), 2)
+
+    def test_log_session(self):
+        user = User.objects.get()
+        routine = user.user_profile.add_routine()
+        bench = routine.add_exercise(name='BENCH_PRESS')
+        press = routine.add_exercise(name='OVERHEAD_PRESS')
+        login_user(self.client)
+
+        res = self.client.post('/log-session/', content_type='application/json', data=json.dumps({
+            'timestamp': '2017-01-03T18:00:00',
+            'exercises': [
+                {'exercise_id': bench.id, 'sets': [5, 5, 5], 'weights_per_set': [185, 185, 185]},
+                {'exercise_id': press.id, 'sets': '8, 8', 'weights_per_set': '95, 95'},
+            ]
+        }))
+        ids = res.json()['ids']
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(ExerciseHistory.objects.get(pk=ids[1]).weights_per_set, [95, 95])
+
+        # Nothing is written if any entry is invalid
+        res = self.client.post('/log-session/', content_type='application/json', data=json.dumps({
+            'exercises': [
+                {'exercise_id': bench.id, 'sets': [5], 'weights_per_set': [185]},
+                {'exercise_id': bench.id, 'sets': 'five', 'weights_per_set': [185]},
+                {'exercise_id': Exercise.objects.create().id, 'sets': [5], 'weights_per_set': [185]},
+            ]
+        }))
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(sorted(res.json()['errors']), ['1', '2'])
+        self.assertEqual(ExerciseHistory.objects.count(), 2)
+
+        # Malformed entries are rejected rather than failing the request
+        res = self.client.post('/log-session/', content_type='application/json', data=json.dumps({
+            'exercises': [
+                {'exercise_id': 'abc', 'sets': [5], 'weights_per_set': [185]},
+                'not an entry',
+                {'exercise_id': str(bench.id), 'sets': [5], 'weights_per_set': [185]},
+            ]
+        }))
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(sorted(res.json()['errors']), ['0', '1'])
+        for payload in ({'exercises': 'none'}, [], {'exercises': [], 'timestamp': '2017-13-45T00:00:00'}):
+            res = self.client.post('/log-session/', content_type='application/json', data=json.dumps(payload))
+            self.assertEqual(res.json()['reason'], 'INVALID_PAYLOAD')
+        self.assertEqual(ExerciseHistory.objects.count(), 2)
+
+    def test_exercise_analytics(self):
+        exercise = User.objects.get().user_profile.add_routine().add_exercise()
+        login_user(self.client)
+        day = datetime.datetime.strptime('2017-01-01', '%Y-%m-%d')
+        exercise.add_history(timestamp=day, sets=[5, 5], weights_per_set=[100, 100])
+        exercise.add_history(timestamp=day + datetime.timedelta(days=2), sets=[1], weights_per_set=[150])
+        exercise.add_history(timestamp=day + datetime.timedelta(days=4), sets=[10], weights_per_set=[100])
+
+        res = self.client.get('/exercise-analytics/{}/'.format(exercise.id), {'window': 2})
+        progression = res.json()['progression']
+        self.assertEqual(progression['estimated_one_rep_max'], [116.67, 150.0, 133.33])
+        self.assertEqual(progression['tonnage'], [1000, 150, 1000])
+        self.assertEqual(progression['rolling_tonnage'], [1000.0, 575.0, 575.0])
+        self.assertEqual(progression['one_rep_max_pr'], [True, True, False])
+
+        res = self.client.get('/exercise-analytics/{}/'.format(exercise.id), {'formula': 'unknown'})
+        self.assertEqual(res.status_code, 400)
+
+        # Only the owner's exercises
+        res = self.client.get('/exercise-analytics/{}/'.format(Exercise.objects.create().id))
+        self.assertEqual(res.status_code, 404)
+        self.client.logout()
+        res = self.client.get('/exercise-analytics/{}/'.format(exercise.id))
+        self.assertEqual(res.status_code, 302)
+
+    def test_load_history_pads_sets(self):
+        exercise = Exercise.objects.create()
+        day = datetime.datetime(2017, 1, 1, tzinfo=pytz.utc)
+        exercise.add_history(timestamp=day, sets=[5, 5, 3], weights_per_set=[100, 110])
+        exercise.add_history(timestamp=day - datetime.timedelta(days=1), sets=[8], weights_per_set=[60])
+        exercise.add_history(timestamp=day + datetime.timedelta(days=1), sets=[1] * 10, weights_per_set=[200] * 10)
+        ids, timestamps, reps, weights = analytics.load_history(exercise)
+        self.assertEqual(reps.shape, (3, analytics.MAX_SETS))
+        self.assertEqual(reps[:2, :3].tolist(), [[8, 0, 0], [5, 5, 0]])
+        self.assertEqual(weights[:2, :3].tolist(), [[60, 0, 0], [100, 110, 0]])
+        self.assertEqual((reps[2].sum(), weights[2].sum()), (10, 2000))
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(analytics.load_history(Exercise.objects.create())[2].shape, (0, analytics.MAX_SETS))
+
     def test_exercise_history_endpoints(self):
         exercise = Exercise.objects.create()
         start_date = datetime.datetime.strptime('2017-01-01', '%Y-%m-%d')
@@ -203,6 +459,28 @@ class TestExerciseHistory(TestCase, TestMixin):
             'end_date': '2017-01-02',
         })
         self.assertEqual(2, len(res.json()['history']))
+        self.assertIsNone(res.json()['next'])
+
+        # Walk the whole range a page at a time
+        seen, cursor = [], None
+        while True:
+            data = {'start_date': '2017-01-01', 'end_date': '2017-01-15', 'page_size': 4}
+            if cursor:
+                data['cursor'] = cursor
+            page = self.get_ajax('/exercise-history-list/{}/'.format(exercise.id), data).json()
+            seen.extend(x['id'] for x in page['history'])
+            cursor = page['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(exercise.history.order_by('timestamp', 'id').values_list('id', flat=True)))
+
+        # Without a cursor or page_size the whole range comes back at once, as before pagination
+        with mock.patch.object(workout_views, 'get_page_size', return_value=4):
+            res = self.get_ajax('/exercise-history-list/{}/'.format(exercise.id), {
+                'start_date': '2017-01-01',
+                'end_date': '2017-01-15',
+            }).json()
+        self.assertEqual((len(res['history']), res['next']), (15, None))
 
         # Test context data in template
         res = self.client.get('/exercise-history-list/{}/'.format(exercise.id), data={
@@ -220,3 +498,849 @@ class TestExerciseHistory(TestCase, TestMixin):
         res = self.client.get('/exercise-history/{}/'.format(history.id))
         self.assertEqual(res.context['history'], history)
 
+
+class TestDateWindows(SimpleTestCase):
+    def test_day_window_across_dst(self):
+        tz = pytz.timezone('America/New_York')
+        start, end = date_windows.day_window(datetime.date(2017, 3, 12), tz)
+        self.assertEqual(end - start, datetime.timedelta(hours=23))
+        self.assertEqual(timezone.localtime(start, tz).hour, 0)
+
+    def test_aware_datetimes_use_local_date(self):
+        tz = pytz.timezone('America/Los_Angeles')
+        late_evening = pytz.utc.localize(datetime.datetime(2017, 1, 4, 5, 0))  # Jan 3rd, 9pm in Los Angeles
+        start, end = date_windows.day_window(late_evening, tz)
+        self.assertEqual(timezone.localtime(start, tz).date(), datetime.date(2017, 1, 3))
+
+    def test_week_and_month_windows(self):
+        start, end = date_windows.week_window(datetime.date(2017, 1, 4), pytz.utc)
+        self.assertEqual((start.date(), end.date()), (datetime.date(2017, 1, 1), datetime.date(2017, 1, 8)))
+        start, end = date_windows.month_window(datetime.date(2017, 12, 31), pytz.utc)
+        self.assertEqual((start.date(), end.date()), (datetime.date(2017, 12, 1), datetime.date(2018, 1, 1)))
+
+    def test_defaults_are_evaluated_per_call(self):
+        self.assertEqual(date_windows.day_window()[0].date(), timezone.now().date())
+        self.assertEqual(date_windows.parse_day('not-a-date', 'default'), 'default')
+
+
+@override_settings(WORKOUT_JOBS_EAGER=True)
+class TestExerciseDailyVolume(TestCase, TestMixin):
+    def setUp(self):
+        self.exercise = Exercise.objects.create()
+        self.day = datetime.datetime.strptime('2017-01-03', '%Y-%m-%d')
+
+    def test_rollup_tracks_history(self):
+        self.exercise.add_history(timestamp=self.day, sets=[10, 8], weights_per_set=[100, 120])
+        history = self.exercise.add_history(timestamp=self.day, sets=[5], weights_per_set=[150])
+        rollup = ExerciseDailyVolume.objects.get(exercise=self.exercise)
+        self.assertEqual(
+            (rollup.total_reps, rollup.total_tonnage, rollup.set_count, rollup.max_weight),
+            (23, 10 * 100 + 8 * 120 + 5 * 150, 3, 150)
+        )
+
+        # Moving a history to another day refreshes both days
+        history.update(timestamp=self.day + datetime.timedelta(days=1))
+        self.assertEqual(ExerciseDailyVolume.objects.filter(exercise=self.exercise).count(), 2)
+        self.assertEqual(self.exercise.get_daily_volume(self.day, self.day).get().set_count, 2)
+
+        history.delete()
+        self.assertEqual(ExerciseDailyVolume.objects.filter(exercise=self.exercise).count(), 1)
+
+    def test_rebuild_command(self):
+        self.exercise.add_history(timestamp=self.day, sets=[10], weights_per_set=[100])
+        self.exercise.add_history(timestamp=self.day + datetime.timedelta(days=7), sets=[10], weights_per_set=[100])
+        ExerciseDailyVolume.objects.all().update(total_reps=0)
+        call_command('rebuild_daily_volume')
+        rows = list(ExerciseDailyVolume.objects.filter(exercise=self.exercise))
+        self.assertEqual([x.total_reps for x in rows], [10, 10])
+        weeks = self.exercise.get_weekly_volume(self.day, self.day + datetime.timedelta(days=7))
+        self.assertEqual(len(weeks), 2)
+
+
+class TestImportHistory(TestCase, TestMixin):
+    def setUp(self):
+        self.user = create_user()
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercise = routine.add_exercise(name='BENCH_PRESS', sets=[5, 5, 5])
+
+    def import_file(self, suffix, content, **options):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        stdout = io.StringIO()
+        try:
+            call_command('import_history', path, user=self.user.username, stdout=stdout,
+                         stderr=open(os.devnull, 'w'), **options)
+        finally:
+            os.remove(path)
+        return stdout.getvalue()
+
+    def test_import_csv(self):
+        self.import_file('.csv', (
+            'exercise,timestamp,sets,weights_per_set,notes\n'
+            'Bench Press,2017-01-03T10:00:00,"5, 5, 5","185, 185, 185",felt good\n'
+            '{},2017-01-04T10:00:00,"5, 5","195, 195",\n'
+            'Squat,2017-01-05T10:00:00,5,225,\n'
+        ).format(self.exercise.id), batch_size=1)
+        self.assertEqual(self.exercise.history.count(), 2)
+        self.assertEqual(self.exercise.daily_volume.count(), 2)
+
+    def test_import_jsonl(self):
+        self.import_file('.jsonl', (
+            '{"exercise": "BENCH_PRESS", "timestamp": "2017-01-03T10:00:00", "sets": [5, 5], '
+            '"weights_per_set": [185, 185]}\n'
+        ))
+        history = self.exercise.history.get()
+        self.assertEqual(history.weights_per_set, [185, 185])
+
+    def test_import_jsonl_skips_bad_lines(self):
+        output = self.import_file('.jsonl', (
+            '{"exercise": "BENCH_PRESS", "timestamp": "2017-01-03T10:00:00", "sets": [5], '
+            '"weights_per_set": [185]}\n'
+            '{"exercise": "BENCH_PRESS", \n'
+            '[1, 2, 3]\n'
+        ))
+        self.assertEqual(self.exercise.history.count(), 1)
+        self.assertIn('Imported 1 rows, skipped 2', output)
+
+    def test_user_is_required(self):
+        with self.assertRaises(CommandError):
+            call_command('import_history', 'history.csv', stdout=open(os.devnull, 'w'))
+
+
+class TestExportHistory(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        exercise = routine.add_exercise(name='BENCH_PRESS')
+        for reps in range(5):
+            exercise.add_history(sets=[reps], weights_per_set=[100])
+        Exercise.objects.create().add_history(sets=[1], weights_per_set=[1])  # Not the user's history
+
+    def test_export_csv(self):
+        login_user(self.client)
+        res = self.client.get('/export-history/', {'format': 'csv'})
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('id,exercise_id,exercise'))
+
+    def test_export_ndjson_chunks(self):
+        login_user(self.client)
+        with mock.patch.object(workout_views.ExportHistoryView, 'chunk_size', 2):
+            res = self.client.get('/export-history/', {'format': 'ndjson'})
+            rows = [json.loads(x) for x in b''.join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([x['sets'] for x in rows], [[0], [1], [2], [3], [4]])
+
+
+@override_settings(WORKOUT_PROFILING=True)
+class TestProfiling(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        profiling.store.clear()
+
+    def test_percentiles(self):
+        self.assertEqual(profiling.percentiles(list(range(1, 101))), {'p50': 50, 'p95': 95, 'p99': 99, 'max': 100})
+        self.assertEqual(profiling.percentiles([]), {})
+        self.assertEqual(profiling.percentiles([1, 2, 3, 4]), {'p50': 2, 'p95': 4, 'p99': 4, 'max': 4})
+        self.assertEqual(profiling.percentiles([7]), {'p50': 7, 'p95': 7, 'p99': 7, 'max': 7})
+
+    def test_requests_are_profiled(self):
+        login_user(self.client)
+        self.user.user_profile.add_routine()
+        res = self.client.get('/routines/')
+        self.assertIn('sql;dur=', res['Server-Timing'])
+
+        summary = profiling.store.summary()['routine_list']
+        self.assertEqual(summary['count'], 1)
+        self.assertGreater(summary['queries']['max'], 0)
+
+        # Profiles are only visible to staff
+        self.assertEqual(self.client.get('/profiling/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn('routine_list', self.client.get('/profiling/').json()['profiles'])
+
+    def test_queries_are_counted_past_the_log_limit(self):
+        login_user(self.client)
+        with mock.patch.object(connection, 'queries_log', collections.deque(maxlen=2)):
+            self.client.get('/routines/')
+        self.assertGreater(profiling.store.summary()['routine_list']['queries']['max'], 2)
+
+    @override_settings(WORKOUT_PROFILING_MEMORY=True)
+    def test_memory_is_traced_across_requests(self):
+        self.addCleanup(tracemalloc.stop)
+        login_user(self.client)
+        self.client.get('/routines/')
+        self.client.get('/routines/')
+        self.assertTrue(tracemalloc.is_tracing())
+        summary = profiling.store.summary()['routine_list']
+        self.assertEqual((summary['count'], summary['memory_kb']['max'] >= 0), (2, True))
+
+
+class TestBenchmarks(TestCase, TestMixin):
+    def test_synthetic_data(self):
+        created = synthetic.generate(users=2, routines_per_user=2, exercises_per_routine=2, years=1)
+        self.assertEqual((created['users'], created['routines'], created['exercises']), (2, 4, 8))
+        self.assertEqual(ExerciseHistory.objects.count(), created['history'])
+        self.assertGreater(created['history'], 8 * 40)  # ~52 weekly sessions with some skipped
+        self.assertTrue(ExerciseDailyVolume.objects.exists())
+
+    def test_benchmark_covers_every_url(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            call_command('benchmark_endpoints', iterations=1, warmup=0, years=0.2, output=path,
+                         stdout=open(os.devnull, 'w'))
+            with open(path) as f:
+                results = json.load(f)['results']
+        finally:
+            os.remove(path)
+        self.assertEqual(sorted(results), sorted(x.name for x in urlpatterns if getattr(x, 'name', None)))
+        self.assertEqual(User.objects.filter(username__startswith='synthetic-').count(), 0)  # Rolled back
+
+
+class TestApi(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercise = self.routine.add_exercise(name='BENCH_PRESS', sets=[5, 5, 5])
+        for day in range(1, 6):
+            self.exercise.add_history(timestamp=datetime.datetime(2017, 1, day), sets=[5], weights_per_set=[100 + day])
+        Routine.objects.create(name='Not mine')
+        login_user(self.client)
+
+    def test_field_selection(self):
+        res = self.client.get('/api/v1/routines/', {'fields': 'name'})
+        self.assertEqual(res.json(), [{'id': self.routine.id, 'name': 'Push'}])
+
+        res = self.client.get('/api/v1/exercises/{}/'.format(self.exercise.id), {'fields': 'sets,bogus'})
+        self.assertEqual(res.json(), {'id': self.exercise.id, 'sets': [5, 5, 5]})
+
+    def test_history_pages(self):
+        res = self.client.get('/api/v1/history/', {
+            'exercise': self.exercise.id, 'page_size': 3, 'fields': 'weights_per_set'})
+        page = res.json()
+        self.assertEqual([x['weights_per_set'] for x in page['results']], [[101], [102], [103]])
+        res = self.client.get('/api/v1/history/', {'exercise': self.exercise.id, 'cursor': page['next']})
+        self.assertEqual([x['weights_per_set'] for x in res.json()['results']], [[104], [105]])
+        self.assertIsNone(res.json()['next'])
+
+        res = self.client.get('/api/v1/history/', {'start_date': '2017-01-02', 'end_date': '2017-01-03'})
+        self.assertEqual(len(res.json()['results']), 2)
+
+    def test_etag(self):
+        res = self.client.get('/api/v1/exercises/')
+        etag = res['ETag']
+        res = self.client.get('/api/v1/exercises/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+        self.exercise.update(rest_duration=90)
+        res = self.client.get('/api/v1/exercises/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/v1/routines/').status_code, 403)
+
+
+@jobs.task('test_flaky')
+def flaky_task(fail_times):
+    FLAKY_CALLS.append(1)
+    if len(FLAKY_CALLS) <= fail_times:
+        raise RuntimeError('Flaky failure')
+
+
+FLAKY_CALLS = []
+
+
+class TestJobs(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        create_user()
+        del FLAKY_CALLS[:]
+
+    def test_history_changes_are_queued(self):
+        exercise = Exercise.objects.create()
+        history = exercise.add_history(timestamp=datetime.datetime(2017, 1, 3), sets=[5], weights_per_set=[100])
+        self.client.post('/edit-exercise-history/{}/'.format(history.id), data={
+            'sets': '5, 5',
+            'weights_per_set': '100, 100',
+        })
+        # Both changes to the same day share one pending job, and nothing is rolled up yet
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+        self.assertFalse(ExerciseDailyVolume.objects.exists())
+
+        call_command('run_workers', concurrency=1, once=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(ExerciseDailyVolume.objects.get().set_count, 2)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_rollup_bumps_watermark(self):
+        profile = UserProfile.objects.get()
+        exercise = profile.add_routine(day='MONDAY').add_exercise()
+        exercise.add_history(sets=[5], weights_per_set=[100])
+        saved_at = UserProfile.get_data_changed_at(profile.user_id)
+        jobs.work(once=True)
+        # Pages caching the rollup against the watermark must not keep serving the pre-rollup version
+        self.assertGreater(UserProfile.get_data_changed_at(profile.user_id), saved_at)
+
+    def test_retries(self):
+        job = jobs.enqueue('test_flaky', max_attempts=2, fail_times=1)
+        jobs.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('Flaky failure', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)  # Skip the backoff
+        jobs.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+    def test_gives_up_after_max_attempts(self):
+        job = jobs.enqueue('test_flaky', max_attempts=1, fail_times=5)
+        jobs.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+
+class TestBulkEdits(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercises = [self.routine.add_exercise(priority=x) for x in range(3)]
+        self.other_routine = Routine.objects.create(name='Not mine')
+        login_user(self.client)
+
+    def post_json(self, url, data):
+        return self.client.post(url, data=json.dumps(data), content_type='application/json')
+
+    def test_reorder_exercises(self):
+        ids = [x.id for x in reversed(self.exercises)]
+        # Session, user, savepoint pair, the UPDATE, the sync log's profile lookup and INSERT, and the watermark
+        with self.assertNumQueries(8):
+            res = self.post_json('/exercises/bulk/', {'action': 'reorder', 'routine_id': self.routine.id, 'ids': ids})
+        self.assertEqual(res.json()['updated'], 3)
+        self.assertEqual(list(self.routine.exercises.order_by('priority').values_list('id', flat=True)), ids)
+
+    def test_delete_exercises(self):
+        doomed, kept = self.exercises[:2], self.exercises[2]
+        for exercise in self.exercises:
+            for day in range(1, 4):
+                exercise.add_history(timestamp=datetime.datetime(2017, 1, day, tzinfo=pytz.utc), sets=[5],
+                                     weights_per_set=[100])
+        jobs.work(once=True)  # The rollups
+        # Session, user, savepoint pair, the ownership count, four DELETEs, the sync log's profile lookup and
+        # INSERT, and the watermark, however much history there is
+        with self.assertNumQueries(12):
+            res = self.post_json('/exercises/bulk/', {'action': 'delete', 'ids': [x.id for x in doomed]})
+        self.assertEqual(res.json()['deleted'], 2)
+        self.assertEqual(list(Exercise.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(set(ExerciseHistory.objects.values_list('exercise_id', flat=True)), {kept.id})
+        self.assertFalse(ExerciseDailyVolume.objects.filter(exercise_id__in=[x.id for x in doomed]).exists())
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.filter(model='exercise', action='delete').values_list('object_id', flat=True)),
+            sorted(x.id for x in doomed))
+
+        res = self.post_json('/exercises/bulk/', {'action': 'delete', 'ids': [kept.id, doomed[0].id]})
+        self.assertEqual(res.status_code, 404)
+        self.assertTrue(Exercise.objects.filter(pk=kept.id).exists())
+
+    def test_update_routines(self):
+        other = self.user.user_profile.add_routine(name='Legs', day='FRIDAY')
+        res = self.post_json('/routines/bulk/', {'action': 'update', 'changes': [
+            {'id': self.routine.id, 'name': 'Chest'},
+            {'id': other.id, 'day': 'SATURDAY'},
+        ]})
+        self.assertEqual(res.json()['updated'], 2)
+        self.assertEqual(
+            sorted(Routine.objects.filter(user__user=self.user).values_list('name', 'day')),
+            [('Chest', 'MONDAY'), ('Legs', 'SATURDAY')]
+        )
+
+        res = self.post_json('/routines/bulk/', {'action': 'update', 'changes': [{'id': other.id, 'day': 'FUNDAY'}]})
+        self.assertEqual(res.status_code, 400)
+
+    def test_ownership(self):
+        res = self.post_json('/routines/bulk/', {'action': 'delete', 'ids': [self.routine.id, self.other_routine.id]})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(Routine.objects.count(), 2)  # Rolled back
+
+        res = self.post_json('/routines/bulk/', {'action': 'delete', 'ids': [self.routine.id]})
+        self.assertEqual(res.json()['deleted'], 1)
+        jobs.work(once=True)  # The purge
+        self.assertEqual(Exercise.objects.count(), 0)
+
+
+class TestDatabaseSettings(SimpleTestCase):
+    def test_sqlite_without_environment(self):
+        databases, routers = databases_from_env('/app', environ={})
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(routers, [])
+
+    def test_sqlite_replica_mirrors_default(self):
+        databases, routers = databases_from_env('/app', environ={'PYFIT_DB_SQLITE_REPLICA': 'true'})
+        self.assertEqual(databases['replica_1']['NAME'], databases['default']['NAME'])
+        self.assertEqual(databases['replica_1']['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(routers, ['pyfit.routers.PrimaryReplicaRouter'])
+
+    def test_postgres_from_environment(self):
+        databases, routers = databases_from_env('/app', environ={
+            'PYFIT_DB_NAME': 'pyfit',
+            'PYFIT_DB_HOST': 'primary',
+            'PYFIT_DB_STATEMENT_TIMEOUT': '5000',
+            'PYFIT_DB_POOL': 'true',
+            'PYFIT_DB_POOL_MAX': '20',
+            'PYFIT_DB_REPLICA_HOSTS': 'replica-a, replica-b',
+        })
+        self.assertEqual(sorted(databases), ['default', 'replica_1', 'replica_2'])
+        self.assertEqual(databases['default']['ENGINE'], 'pyfit.pooled_postgresql')
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 60)
+        self.assertEqual(databases['default']['OPTIONS']['options'], '-c statement_timeout=5000')
+        self.assertEqual(databases['default']['POOL']['MAX'], 20)
+        self.assertEqual(databases['replica_2']['HOST'], 'replica-b')
+        self.assertEqual(databases['replica_1']['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(routers, ['pyfit.routers.PrimaryReplicaRouter'])
+
+    def test_caches_are_shared_with_postgres(self):
+        self.assertEqual(caches_from_env(environ={})['default']['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+        caches = caches_from_env(environ={'PYFIT_DB_NAME': 'pyfit'})
+        self.assertEqual(caches['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+        self.assertEqual(caches['default']['LOCATION'], 'pyfit_cache')
+        caches = caches_from_env(environ={'PYFIT_DB_NAME': 'pyfit', 'PYFIT_CACHE_LOCATION': '127.0.0.1:11211',
+                                          'PYFIT_CACHE_BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'})
+        self.assertEqual(caches['default']['LOCATION'], '127.0.0.1:11211')
+
+
+@override_settings(DATABASES={'default': {}, 'replica_1': {}, 'replica_2': {}})
+class TestReplicaRouter(SimpleTestCase):
+    def tearDown(self):
+        routers._state.use_replica = False
+
+    def test_reads_use_replicas_only_when_allowed(self):
+        router = routers.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Routine), 'default')
+        routers._state.use_replica = True
+        self.assertIn(router.db_for_read(Routine), ('replica_1', 'replica_2'))
+
+        # A write sends the rest of the request back to the primary
+        self.assertEqual(router.db_for_write(Routine), 'default')
+        self.assertEqual(router.db_for_read(Routine), 'default')
+
+    @override_settings(WORKOUT_READ_REPLICAS=False)
+    def test_switch(self):
+        self.assertFalse(routers.replicas_enabled())
+
+
+@override_settings(DATABASES=dict(settings.DATABASES, replica_1={}),
+                   DATABASE_ROUTERS=['pyfit.routers.PrimaryReplicaRouter'])
+class TestReplicaReads(TestCase, TestMixin):
+    """The replica is a separate, never-synced SQLite database here, so what a page shows reveals where it read"""
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestReplicaReads, cls).setUpClass()
+        cls.primary_replica = getattr(connections._connections, 'replica_1', None)
+        replica = load_backend('django.db.backends.sqlite3').DatabaseWrapper(dict(
+            connections['default'].settings_dict, ENGINE='django.db.backends.sqlite3', NAME=':memory:', OPTIONS={},
+        ), 'replica_1')
+        connections['replica_1'] = replica
+        with replica.schema_editor() as editor:
+            for model in apps.get_models():
+                if model._meta.managed and not model._meta.proxy:
+                    editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica_1'].close()
+        if cls.primary_replica is None:
+            del connections['replica_1']
+        else:
+            connections['replica_1'] = cls.primary_replica
+        super(TestReplicaReads, cls).tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        cache.clear()
+        login_user(self.client)
+        self.exercise = self.user.user_profile.add_routine().add_exercise()
+        self.history = self.exercise.add_history(sets=[5], weights_per_set=[100])
+        cache.delete(routers.sticky_cache_key(self.user.id))
+
+    def test_read_paths_use_the_replica(self):
+        with CaptureQueriesContext(connections['replica_1']) as replica:
+            res = self.get_ajax('/exercise-history/{}/'.format(self.history.id), {})
+        self.assertEqual(res.status_code, 404)  # The unsynced replica doesn't have the row
+        self.assertGreater(len(replica.captured_queries), 0)
+
+    def test_sticky_after_write(self):
+        self.client.post('/edit-exercise-history/{}/'.format(self.history.id), data={
+            'sets': '5, 5',
+            'weights_per_set': '100, 100',
+        })
+        res = self.get_ajax('/exercise-history/{}/'.format(self.history.id), {})
+        self.assertEqual(res.json()['history']['id'], self.history.id)
+
+
+@override_settings(WORKOUT_JOBS_EAGER=True)
+class TestDashboard(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        cache.clear()
+        routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercise = routine.add_exercise(name='BENCH_PRESS')
+        self.today = datetime.date(2017, 1, 18)  # A Wednesday
+
+    def log(self, day, weight):
+        self.exercise.add_history(timestamp=datetime.datetime.combine(day, datetime.time(18)),
+                                  sets=[5, 5], weights_per_set=[weight, weight])
+
+    def test_build_dashboard(self):
+        for weeks_ago, weight in ((3, 100), (1, 105), (0, 110)):
+            self.log(self.today - datetime.timedelta(weeks=weeks_ago, days=2), weight)
+        self.log(self.today, 95)
+
+        with self.assertNumQueries(5):
+            data = dashboard.build_dashboard(self.user.id, today=self.today)
+        self.assertEqual(data['week_start'], '2017-01-15')
+        self.assertEqual([x['name'] for x in data['scheduled_routines']], ['Push'])
+        self.assertEqual(data['completed_sessions'], 2)
+        self.assertEqual(data['weekly_tonnage'], 5 * 110 * 2 + 5 * 95 * 2)
+        self.assertEqual(data['week_streak'], 2)  # The week three weeks ago is cut off by a gap
+        self.assertEqual([x['weight'] for x in data['recent_prs']], [110, 105])
+
+    def test_dashboard_view_is_cached(self):
+        login_user(self.client)
+        self.assertEqual(self.get_ajax('/dashboard/', {}).json()['dashboard']['completed_sessions'], 0)
+        self.log(date_windows.today(), 100)
+        self.assertEqual(self.get_ajax('/dashboard/', {}).json()['dashboard']['completed_sessions'], 0)
+        cache.delete(dashboard.dashboard_cache_key(self.user.id))
+        self.assertEqual(self.get_ajax('/dashboard/', {}).json()['dashboard']['completed_sessions'], 1)
+
+
+class TestSync(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercise = self.routine.add_exercise(name='BENCH_PRESS', sets=[5, 5, 5])
+        login_user(self.client)
+
+    def test_changes_are_logged(self):
+        history = self.exercise.add_history(sets=[5], weights_per_set=[100])
+        history.update(notes='Easy')
+        history.delete()
+        self.assertEqual(
+            list(ChangeLogEntry.objects.order_by('id').values_list('model', 'action')),
+            [('routine', 'create'), ('exercise', 'create'), ('history', 'create'), ('history', 'update'),
+             ('history', 'delete')]
+        )
+        self.assertEqual(set(ChangeLogEntry.objects.values_list('user_id', flat=True)), {self.user.user_profile.id})
+
+    def test_full_then_delta_sync(self):
+        res = self.client.get('/sync/').json()
+        self.assertEqual([x['id'] for x in res['upserts']['routine']], [self.routine.id])
+        self.assertEqual([x['id'] for x in res['upserts']['exercise']], [self.exercise.id])
+        self.assertFalse(res['more'])
+
+        self.routine.update(name='Chest')
+        self.routine.update(name='Chest day')
+        other = self.routine.add_exercise(name='SQUAT')
+        other_id = other.id
+        other.delete()
+        # Session, user, the log, its overlap window and one query per model with upserts
+        with self.assertNumQueries(5), mock.patch.object(sync, 'SYNC_OVERLAP', datetime.timedelta(0)):
+            res = self.client.get('/sync/', data={'since': res['next']}).json()
+        self.assertEqual(res['upserts'], {'routine': [{'id': self.routine.id, 'name': 'Chest day', 'day': 'MONDAY'}]})
+        self.assertEqual(res['deletes'], {'exercise': [other_id]})
+
+        # Recent entries are sent again until they are older than the overlap window
+        res = self.client.get('/sync/', data={'since': res['next']}).json()
+        self.assertEqual(res['deletes'], {'exercise': [other_id]})
+        with mock.patch.object(sync, 'SYNC_OVERLAP', datetime.timedelta(0)):
+            res = self.client.get('/sync/', data={'since': res['next']}).json()
+        self.assertEqual((res['upserts'], res['deletes']), ({}, {}))
+
+    def test_late_commits_are_not_skipped(self):
+        since = sync.changes_since(self.user.id)['next']
+        profile_id = self.user.user_profile.id
+        # An entry committed after a later id was already handed out as a token
+        ChangeLogEntry.objects.create(id=int(since) + 5, user_id=profile_id, model='routine',
+                                      object_id=self.routine.id, action=ChangeLogEntry.UPDATE)
+        since = sync.changes_since(self.user.id, since=int(since))['next']
+        ChangeLogEntry.objects.create(id=int(since) - 2, user_id=profile_id, model='exercise',
+                                      object_id=self.exercise.id, action=ChangeLogEntry.UPDATE)
+        res = sync.changes_since(self.user.id, since=int(since))
+        self.assertEqual([x['id'] for x in res['upserts']['exercise']], [self.exercise.id])
+        self.assertEqual(res['next'], since)
+
+    def test_backfill_unlogged_rows(self):
+        history = self.exercise.add_history(sets=[5], weights_per_set=[100])
+        ChangeLogEntry.objects.all().delete()  # As before the change log existed
+        Routine.objects.create(name='Not mine').add_exercise()
+        backfill = importlib.import_module('workout.migrations.0021_backfill_change_log').backfill_change_log
+        backfill(apps, None)
+        backfill(apps, None)  # Logs each row once
+        res = sync.changes_since(self.user.id)
+        self.assertEqual({name: [x['id'] for x in rows] for name, rows in res['upserts'].items()},
+                         {'routine': [self.routine.id], 'exercise': [self.exercise.id], 'history': [history.id]})
+        self.assertEqual(ChangeLogEntry.objects.count(), 3)
+
+    def test_synthetic_history_is_logged(self):
+        synthetic.generate(users=1, routines_per_user=1, exercises_per_routine=1, years=0.1)
+        user = User.objects.get(username__startswith='synthetic-')
+        self.assertEqual(len(sync.changes_since(user.id)['upserts']['history']),
+                         ExerciseHistory.objects.filter(exercise__routine__user__user=user).count())
+
+    def test_bulk_created_history_is_logged(self):
+        created = bulk_create_history([
+            ExerciseHistory(exercise=self.exercise, sets=[5], weights_per_set=[100 + x]) for x in range(3)])
+        self.assertTrue(all(x.pk for x in created))
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.filter(model='history').values_list('object_id', flat=True)),
+            sorted(x.pk for x in created))
+
+    def test_pages(self):
+        for x in range(3):
+            self.routine.add_exercise(priority=x + 1)
+        res = sync.changes_since(self.user.id, limit=2)
+        self.assertTrue(res['more'])
+        with mock.patch.object(sync, 'SYNC_OVERLAP', datetime.timedelta(0)):
+            res = sync.changes_since(self.user.id, since=int(res['next']))
+        self.assertEqual(sorted(x['priority'] for x in res['upserts']['exercise']), [1, 2, 3])
+
+    def test_invalid_token(self):
+        res = self.client.get('/sync/', data={'since': 'abc'})
+        self.assertEqual(res.json()['reason'], 'INVALID_TOKEN')
+
+
+class TestCardio(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Run', day='SUNDAY')
+        self.exercise = self.routine.add_exercise(name='Run', exercise_type='CARDIO')
+        login_user(self.client)
+
+    def upload(self, exercise_id, data):
+        return self.client.post('/exercise/{}/log-cardio/'.format(exercise_id), data=json.dumps(data),
+                                content_type='application/json')
+
+    def test_pack_round_trip(self):
+        data = cardio.pack('heart_rate', [120, None, 300.4])
+        self.assertEqual(len(data), 6)
+        self.assertEqual(list(cardio.unpack('heart_rate', data)), [120, 0, 300])
+        pace = cardio.unpack('pace', cardio.pack('pace', [300.5, None]))
+        self.assertEqual(list(cardio.present('pace', pace)), [True, False])
+
+    def test_lttb_keeps_peaks(self):
+        x = np.arange(1000)
+        y = np.zeros(1000)
+        y[500] = 100
+        kept = cardio.lttb(x, y, 50)
+        self.assertEqual(len(kept), 50)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertIn(500, kept)
+        self.assertEqual(list(cardio.lttb(x[:10], y[:10], 50)), list(range(10)))
+
+    def test_upload_and_downsample(self):
+        res = self.upload(self.exercise.id, {
+            'heart_rate': [140 + x % 10 for x in range(3600)],
+            'distance': [x * 3.0 for x in range(3600)],
+        })
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['summary']['distance'], 10797.0)
+        session = CardioSession.objects.get(pk=res.json()['id'])
+        self.assertEqual(session.sample_count, 3600)
+        self.assertEqual(len(session.heart_rate), 7200)
+        self.assertIsNone(session.pace)
+
+        res = self.client.get('/cardio/{}/'.format(session.pk), data={'points': 200, 'series': 'heart_rate'}).json()
+        self.assertEqual(len(res['series']['heart_rate']), 200)
+        self.assertEqual(res['series']['heart_rate'][-1], [3599.0, 149.0])
+
+    def test_validation(self):
+        self.assertEqual(self.upload(self.exercise.id, {'heart_rate': [1, 2], 'pace': [1]}).json()['reason'],
+                         'INVALID_SAMPLES')
+        lifting = self.routine.add_exercise(name='BENCH_PRESS')
+        self.assertEqual(self.upload(lifting.id, {'heart_rate': [120]}).json()['reason'], 'NOT_CARDIO')
+        other = Routine.objects.create(name='Not mine').add_exercise(exercise_type='CARDIO')
+        self.assertEqual(self.upload(other.id, {'heart_rate': [120]}).status_code, 404)
+
+        for samples in ({'heart_rate': ['fast', 120]}, {'pace': [[1, 2]]}, {'pace': 'fast'}, {'distance': [10 ** 400]},
+                        {'heart_rate': [120] * (cardio.MAX_SAMPLES + 1)}):
+            res = self.upload(self.exercise.id, samples)
+            self.assertEqual((res.status_code, res.json()['reason']), (400, 'INVALID_SAMPLES'))
+        self.assertFalse(CardioSession.objects.exists())
+
+
+class TestPackedIntegerArrayField(TestCase, TestMixin):
+    def setUp(self):
+        self.exercise = Exercise.objects.create(sets=[5, 5, 5])
+
+    def test_pack(self):
+        data = fields.pack([8, -1, 2 ** 31 - 1])
+        self.assertEqual(len(data), 12)
+        view = fields.unpack(data)
+        self.assertEqual(view.tolist(), [8, -1, 2 ** 31 - 1])
+        self.assertEqual(list(fields.as_buffer([1, 2])), [1, 2])
+
+    def test_round_trip(self):
+        history = self.exercise.add_history(weights_per_set=[100, 105, 110])
+        history = ExerciseHistory.objects.get(pk=history.pk)
+        self.assertEqual((history.sets, history.weights_per_set), ([5, 5, 5], [100, 105, 110]))
+        self.assertEqual(list(ExerciseHistory.objects.values_list('sets', flat=True)), [[5, 5, 5]])
+        raw_sets = ExerciseHistory.objects.annotate(raw_sets=fields.raw('sets')).values_list('raw_sets', flat=True)
+        self.assertEqual(list(fields.as_buffer(raw_sets[0])), [5, 5, 5])
+        _, _, reps, weights = analytics.load_history(self.exercise)
+        self.assertEqual(weights[0, :4].tolist(), [100, 105, 110, 0])
+
+    def test_to_python(self):
+        field = ExerciseHistory._meta.get_field('sets')
+        self.assertEqual(field.to_python('[1, 2]'), [1, 2])
+        self.assertEqual(field.to_python(fields.pack([3])), [3])
+        self.assertEqual(field.value_to_string(ExerciseHistory(sets=[4, 5])), '[4, 5]')
+        with self.assertRaises(exceptions.ValidationError):
+            field.clean(list(range(11)), None)
+
+    def test_bulk_update(self):
+        history = self.exercise.add_history(weights_per_set=[100])
+        bulk_update_fields(ExerciseHistory.objects.all(), {history.pk: {'weights_per_set': [120, 120]}})
+        self.assertEqual(ExerciseHistory.objects.get().weights_per_set, [120, 120])
+
+    def test_benchmark_command(self):
+        call_command('benchmark_array_storage', rows=50, repeat=1, stdout=open(os.devnull, 'w'))
+        self.assertEqual(ExerciseHistory.objects.count(), 0)  # Rolled back
+
+
+class TestExerciseSummary(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercise = self.routine.add_exercise(name='BENCH_PRESS', sets=[5, 5, 5])
+        self.now = timezone.now()
+
+    def log(self, days_ago, weight, reps=5):
+        return self.exercise.add_history(timestamp=self.now - datetime.timedelta(days=days_ago),
+                                         sets=[reps, reps], weights_per_set=[weight, weight])
+
+    def summary(self):
+        return Exercise.objects.filter(pk=self.exercise.pk).values(
+            'last_performed_at', 'last_sets', 'last_weights_per_set', 'best_one_rep_max', 'session_count').get()
+
+    def test_logging_updates_summary(self):
+        latest = self.log(1, 100)
+        self.log(7, 150, reps=1)  # Older, but the best
+        summary = self.summary()
+        self.assertEqual(summary['last_performed_at'], latest.timestamp)
+        self.assertEqual((summary['last_sets'], summary['last_weights_per_set']), ([5, 5], [100, 100]))
+        self.assertEqual(summary['best_one_rep_max'], 150)
+        self.assertEqual(summary['session_count'], 2)
+
+    def test_edit_and_delete_recompute(self):
+        older = self.log(7, 100)
+        latest = self.log(1, 120)
+        latest.update(weights_per_set=[90, 90])
+        self.assertAlmostEqual(self.summary()['best_one_rep_max'], 100 * (1 + 5 / 30.0))
+
+        latest.delete()
+        summary = self.summary()
+        self.assertEqual((summary['last_performed_at'], summary['session_count']), (older.timestamp, 1))
+        older.delete()
+        self.assertEqual(self.summary()['last_performed_at'], None)
+        self.assertEqual(self.summary()['best_one_rep_max'], None)
+
+    def test_routine_page_shows_summary_without_queries(self):
+        login_user(self.client)
+        self.log(1, 100)
+        self.client.get('/routine/{}/'.format(self.routine.id))
+        self.log(0, 105)  # Drops the cached plan
+        self.client.get('/routine/{}/'.format(self.routine.id))
+        with self.assertNumQueries(3):  # Session, user and watermark
+            res = self.client.get('/routine/{}/'.format(self.routine.id))
+        self.assertContains(res, '5 x 105')
+        self.assertEqual(res.context['exercises'][0]['session_count'], 2)
+
+    def test_bulk_logging_folds_into_summary(self):
+        self.log(3, 100)
+        bulk_create_history([
+            ExerciseHistory(exercise=self.exercise, timestamp=self.now - datetime.timedelta(days=x),
+                            sets=[5], weights_per_set=[weight])
+            for x, weight in ((10, 200), (1, 110), (2, 90))
+        ])
+        summary = self.summary()
+        self.assertEqual(summary['session_count'], 4)
+        self.assertEqual(summary['last_weights_per_set'], [110])
+        self.assertAlmostEqual(summary['best_one_rep_max'], 200 * (1 + 5 / 30.0))
+
+    def test_rebuild_command(self):
+        self.log(1, 100)
+        Exercise.objects.update(session_count=0, last_performed_at=None, best_one_rep_max=None)
+        call_command('rebuild_exercise_summaries', exercise_ids=[self.exercise.id], stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.summary()['session_count'], 1)
+        self.assertIsNotNone(self.summary()['last_performed_at'])
+
+
+class TestRoutinePurge(TestCase, TestMixin):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user()
+        self.routine = self.user.user_profile.add_routine(name='Push', day='MONDAY')
+        self.exercises = [self.routine.add_exercise(name='BENCH_PRESS') for _ in range(2)]
+        histories = [x.add_history(sets=[5], weights_per_set=[100]) for x in self.exercises for _ in range(5)]
+        CardioSession.objects.create(history=histories[0], sample_count=1, heart_rate=cardio.pack('heart_rate', [120]))
+        self.kept = self.user.user_profile.add_routine(name='Legs', day='FRIDAY')
+        self.kept.add_exercise(name='SQUAT').add_history(sets=[5], weights_per_set=[140])
+        login_user(self.client)
+
+    def test_soft_delete_hides_everything(self):
+        self.post_ajax('/delete-routine/', {'routine_id': self.routine.id})
+        self.assertEqual(list(Routine.objects.values_list('id', flat=True)), [self.kept.id])
+        self.assertEqual(Routine.all_objects.get(pk=self.routine.id).user, None)
+        self.assertEqual(Exercise.objects.filter(routine__user__user=self.user).count(), 1)
+        self.assertEqual(ExerciseHistory.objects.filter(exercise__routine__user__user=self.user).count(), 1)
+        self.assertTrue(Job.objects.filter(key='purge-routine:{}'.format(self.routine.id)).exists())
+        deletes = ChangeLogEntry.objects.filter(action=ChangeLogEntry.DELETE).values_list('model', flat=True)
+        self.assertEqual(sorted(deletes), ['exercise', 'exercise', 'routine'])
+
+    def test_soft_deleted_exercises_are_unreachable(self):
+        purge.soft_delete_routine(self.routine)
+        exercise, history = self.exercises[0], self.exercises[0].history.first()
+        res = self.post_ajax('/exercise/{}/add-history/'.format(exercise.id), {
+            'sets': '5', 'weights_per_set': '100'})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(self.get_ajax('/exercise-history-list/{}/'.format(exercise.id), {}).status_code, 404)
+        self.assertEqual(self.get_ajax('/exercise-history/{}/'.format(history.id), {}).status_code, 404)
+        self.assertEqual(ExerciseHistory.objects.filter(exercise=exercise).count(), 5)
+
+    def test_purge_in_batches(self):
+        purge.soft_delete_routine(self.routine)
+        results = []
+        self.assertEqual(purge.purge_routine(self.routine.id, batch_size=4, progress=results.append), 10)
+        self.assertEqual([(x['deleted'], x['remaining']) for x in results], [(4, 6), (4, 2), (2, 0)])
+        self.assertFalse(Routine.all_objects.filter(pk=self.routine.id).exists())
+        self.assertEqual(Exercise.objects.count(), 1)
+        self.assertEqual(ExerciseHistory.objects.count(), 1)
+        self.assertEqual(CardioSession.objects.count(), 0)
+
+    def test_purge_job_requeues_itself(self):
+        purge.soft_delete_routine(self.routine)
+        Job.objects.filter(name='purge_routine').update(payload=json.dumps({
+            'routine_id': self.routine.id, 'batch_size': 4}))
+        jobs.work(once=True)
+        self.assertEqual(Job.objects.filter(name='purge_routine', status=Job.DONE).count(), 3)
+        self.assertEqual(ExerciseHistory.objects.count(), 1)
+
+    def test_purge_command_skips_live_routines(self):
+        purge.soft_delete_routine(self.routine)
+        call_command('purge_routines', batch_size=3, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(Routine.all_objects.values_list('id', flat=True)), [self.kept.id])
+        self.assertEqual(purge.purge_batch(self.kept.id)['deleted'], 0)
+        self.assertTrue(Routine.objects.filter(pk=self.kept.id).exists())
@@ -1,7 +1,7 @@
 from django.conf.urls import url, include
 from django.contrib import admin
 
-from workout import views as workout_views
+from workout import api, views as workout_views
 
 urlpatterns = [
     url(r'^$', workout_views.DashboardView.as_view()),
@@ -11,21 +11,33 @@ urlpatterns = [
     url(r'^add-routine/$', workout_views.AddRoutineView.as_view(), name='add_routine'),
     url(r'^routines/$', workout_views.RoutineListView.as_view(), name='routine_list'),
     url(r'^routine/(?P<routine_id>[0-9]+)/$', workout_views.RoutineDetailView.as_view(), name='routine_detail'),
+    url(r'^routines/bulk/$', workout_views.BulkRoutineView.as_view(), name='bulk_routines'),
     url(r'^delete-routine/$', workout_views.DeleteRoutineView.as_view(), name='delete_routine'),
     url(r'^edit-routine/$', workout_views.EditRoutineView.as_view(), name='edit_routine'),
     url(r'^add-exercise/$', workout_views.AddExerciseView.as_view(),
         name='add_exercise'),
+    url(r'^exercises/bulk/$', workout_views.BulkExerciseView.as_view(), name='bulk_exercises'),
     url(r'^delete-exercise/$', workout_views.DeleteExerciseView.as_view(), name='delete_exercise'),
     url(r'^exercise/(?P<exercise_id>[0-9]+)/$', workout_views.ExerciseDetailView.as_view(), name='exercise_detail'),
     url(r'^edit-exercise/$', workout_views.EditExerciseView.as_view(), name='edit_exercise'),
     url(r'^exercise/(?P<exercise_id>[0-9]+)/add-history/$', workout_views.AddExerciseHistoryView.as_view(),
         name='add_exercise_history'),
+    url(r'^log-session/$', workout_views.LogSessionView.as_view(), name='log_session'),
+    url(r'^exercise/(?P<exercise_id>[0-9]+)/log-cardio/$', workout_views.LogCardioView.as_view(),
+        name='log_cardio'),
+    url(r'^cardio/(?P<history_id>[0-9]+)/$', workout_views.CardioSamplesView.as_view(), name='cardio_samples'),
     url(r'^edit-exercise-history/(?P<history_id>[0-9]+)/$', workout_views.EditExerciseHistoryView.as_view(),
         name='edit_exercise_history'),
     url(r'^delete-exercise-history/(?P<history_id>[0-9]+)/$', workout_views.DeleteExerciseHistoryView.as_view(),
         name='delete_exercise_history'),
     url(r'^exercise-history-list/(?P<exercise_id>[0-9]+)/$', workout_views.ExerciseHistoryListView.as_view(),
         name='exercise_history_list'),
+    url(r'^exercise-analytics/(?P<exercise_id>[0-9]+)/$', workout_views.ExerciseAnalyticsView.as_view(),
+        name='exercise_analytics'),
     url(r'^exercise-history/(?P<history_id>[0-9]+)/$', workout_views.ExerciseHistoryDetailView.as_view(),
-        name='exercise_history_detail')
+        name='exercise_history_detail'),
+    url(r'^export-history/$', workout_views.ExportHistoryView.as_view(), name='export_history'),
+    url(r'^sync/$', workout_views.SyncView.as_view(), name='sync'),
+    url(r'^profiling/$', workout_views.ProfilingStatsView.as_view(), name='profiling_stats'),
+    url(r'^api/v1/', include(api.router.urls)),
 ]
@@ -1,20 +1,42 @@
+import csv
 import datetime
+import json
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core import exceptions
 from django.core.urlresolvers import reverse_lazy
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView, CreateView, UpdateView, DeleteView
-from django.views.generic.edit import FormView, View
+from django.views.generic.edit import FormView, ModelFormMixin, View
 
+from . import analytics, cardio, date_windows, profiling
+from .dashboard import get_dashboard
 from .forms import (RegistrationForm,
                     LoginForm,
                     RoutineForm,
                     ExerciseForm,
                     ExerciseHistoryForm,
                     )
-from .models import Routine, Exercise, ExerciseHistory
+from .models import (UserProfile,
+                     Routine,
+                     Exercise,
+                     ExerciseHistory,
+                     ChangeLogEntry,
+                     CardioSession,
+                     bulk_create_history,
+                     bulk_update_fields,
+                     )
+from .pagination import InvalidCursor, get_page_size, paginate_by_keyset
+from .plan_cache import build_plan, get_weekly_plan, invalidate_weekly_plan
+from .purge import delete_exercises, soft_delete_routine
+from .sync import MODEL_NAMES, changes_since, record_changes
 
 
 class AjaxableResponseMixin(object):
@@ -43,6 +65,90 @@ class AjaxableResponseMixin(object):
             return response
 
 
+def live_exercises():
+    """Exercises whose routine hasn't been soft deleted, the only ones users can view or add history to"""
+    return Exercise.objects.filter(routine__deleted_at__isnull=True)
+
+
+def live_history():
+    return ExerciseHistory.objects.filter(exercise__routine__deleted_at__isnull=True)
+
+
+# URL kwargs of pages showing one owner's data, and how to reach that owner's profile from them
+DATA_OWNER_LOOKUPS = (
+    ('routine_id', 'routines'),
+    ('exercise_id', 'routines__exercises'),
+    ('history_id', 'routines__exercises__history'),
+)
+
+
+def get_data_changed_at(request, **kwargs):
+    """
+    The change watermark of whoever owns the data a page shows, fetched at most once per request.
+    Pages about one routine, exercise or history row use its owner's, which need not be the requester.
+    """
+    if not hasattr(request, '_data_changed_at'):
+        for kwarg, lookup in DATA_OWNER_LOOKUPS:
+            if kwarg in kwargs:
+                request._data_changed_at = UserProfile.get_data_changed_at(**{lookup: kwargs[kwarg]})
+                break
+        else:
+            request._data_changed_at = UserProfile.get_data_changed_at(request.user.id)
+    return request._data_changed_at
+
+
+def user_data_etag(request, *args, **kwargs):
+    """
+    ETag for pages built only from one user's data. Includes the date because reports
+    default to windows ending today, and whether it's the AJAX JSON or the HTML page.
+    """
+    changed = get_data_changed_at(request, **kwargs)
+    if changed is None:
+        return None
+    return '{}-{}-{}-{}'.format(request.user.id, changed.isoformat(), date_windows.today().isoformat(),
+                                'json' if request.is_ajax() else 'html')
+
+
+def user_data_last_modified(request, *args, **kwargs):
+    """The watermark, but never before today's midnight, so a new day's default report window isn't a 304"""
+    changed = get_data_changed_at(request, **kwargs)
+    if changed is None:
+        return None
+    return max(changed, date_windows.day_window()[0])
+
+
+conditional_on_user_data = method_decorator(
+    condition(etag_func=user_data_etag, last_modified_func=user_data_last_modified), name='dispatch')
+
+
+def as_form_value(value):
+    """Turn a JSON value into what a form field expects, e.g. lists into SimpleArrayField's comma separated string"""
+    if isinstance(value, list):
+        return ','.join(str(x) for x in value)
+    return '' if value is None else value
+
+
+def parse_id(value):
+    """An id sent in JSON as a number or a string of digits, otherwise None"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+class DirtyFieldsUpdateMixin(object):
+    """
+    For UpdateViews of ModelMixin models. Writes only the columns the form changed,
+    and nothing at all when the submitted values match what's stored.
+    """
+    def form_valid(self, form):
+        self.object = form.save(commit=False)
+        self.object.save_dirty()
+        form.save_m2m()
+        return super(ModelFormMixin, self).form_valid(form)
+
+
 class SignupView(FormView):
     template_name = 'accounts/signup.html'
     form_class = RegistrationForm
@@ -73,6 +179,18 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     login_url = '/login/'
     template_name = 'dashboard.html'
 
+    def get(self, request, *args, **kwargs):
+        if request.is_ajax():
+            return JsonResponse({
+                'success': True,
+                'dashboard': get_dashboard(request.user.id),
+            })
+        return super(DashboardView, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        kwargs['dashboard'] = get_dashboard(self.request.user.id)
+        return super(DashboardView, self).get_context_data(**kwargs)
+
 
 class AddRoutineView(AjaxableResponseMixin, CreateView):
     model = Routine
@@ -83,28 +201,39 @@ class AddRoutineView(AjaxableResponseMixin, CreateView):
         return super(AddRoutineView, self).form_valid(form)
 
 
+@conditional_on_user_data
 class RoutineListView(TemplateView):
     template_name = 'workout/routines/routine-list.html'
 
     def get_context_data(self, **kwargs):
-        kwargs['routines'] = list(self.request.user.user_profile.routines.all())
-        kwargs['routines'].sort()
+        kwargs['routines'] = get_weekly_plan(self.request.user.id)
         kwargs['add_routine_form'] = RoutineForm()
         kwargs['edit_routine_form'] = RoutineForm()
         return super(RoutineListView, self).get_context_data(**kwargs)
 
 
+@conditional_on_user_data
 class RoutineDetailView(TemplateView):
     template_name = 'workout/exercises/routine-exercise-list.html'
 
     def get_context_data(self, **kwargs):
-        kwargs['routine'] = Routine.objects.get(pk=self.kwargs['routine_id'])
-        kwargs['exercises'] = list(kwargs['routine'].exercises.all())
-        kwargs['exercises'].sort()
+        kwargs['routine'] = self.get_routine()
+        kwargs['exercises'] = kwargs['routine']['exercises']
         kwargs['edit_exercise_form'] = ExerciseForm()
         kwargs['add_exercise_form'] = ExerciseForm()
         return super(RoutineDetailView, self).get_context_data(**kwargs)
 
+    def get_routine(self):
+        routine_id = int(self.kwargs['routine_id'])
+        if self.request.user.is_authenticated():
+            for routine in get_weekly_plan(self.request.user.id):
+                if routine['id'] == routine_id:
+                    return routine
+        plan = build_plan(Routine.objects.filter(pk=routine_id))
+        if not plan:
+            raise Routine.DoesNotExist()
+        return plan[0]
+
 
 class DeleteRoutineView(AjaxableResponseMixin, DeleteView):
     model = Routine
@@ -113,8 +242,14 @@ class DeleteRoutineView(AjaxableResponseMixin, DeleteView):
     def get_object(self, queryset=None):
         return Routine.objects.get(pk=self.request.POST['routine_id'])
 
+    def delete(self, request, *args, **kwargs):
+        # Hidden now, its exercises and history are purged in batches by a background job
+        self.object = self.get_object()
+        soft_delete_routine(self.object)
+        return HttpResponseRedirect(self.get_success_url())
 
-class EditRoutineView(AjaxableResponseMixin, UpdateView):
+
+class EditRoutineView(AjaxableResponseMixin, DirtyFieldsUpdateMixin, UpdateView):
     form_class = RoutineForm
     model = Routine
 
@@ -139,7 +274,7 @@ class DeleteExerciseView(AjaxableResponseMixin, View):
         return reverse_lazy('routine_detail', kwargs={'routine_id': self.routine_id})
 
     def get_object(self):
-        exercise = Exercise.objects.get(pk=self.request.POST['exercise_id'])
+        exercise = live_exercises().get(pk=self.request.POST['exercise_id'])
         self.routine_id = exercise.routine_id
         return exercise
 
@@ -159,16 +294,148 @@ class DeleteExerciseView(AjaxableResponseMixin, View):
             })
 
 
+class BulkEditView(LoginRequiredMixin, View):
+    """
+    Set-based changes to many of the user's rows in one request and one transaction. Expects JSON like
+    {"action": "delete", "ids": [1, 2]} or {"action": "update", "changes": [{"id": 1, "name": "..."}]}.
+    Ownership is part of every statement's WHERE clause, and if any id isn't the user's nothing is changed.
+    """
+    login_url = '/login/'
+    model = None
+    form_class = None
+    owner_lookup = 'user__user_id'  # From model to the owning auth user's id
+    actions = ('delete', 'update')
+
+    def get_queryset(self):
+        return self.model.objects.filter(**{self.owner_lookup: self.request.user.id})
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            action = data['action']
+        except (ValueError, KeyError, TypeError):
+            return self.error('INVALID_PAYLOAD')
+        if action not in self.actions:
+            return self.error('UNKNOWN_ACTION')
+
+        try:
+            with transaction.atomic():
+                response = getattr(self, 'bulk_{}'.format(action))(data)
+                if response.status_code != 200:
+                    transaction.set_rollback(True)
+        except (ValueError, KeyError, TypeError):
+            return self.error('INVALID_PAYLOAD')
+        if response.status_code == 200:
+            # Queryset updates and deletes skip the signals that normally do this
+            invalidate_weekly_plan(user_ids=[request.user.id])
+            UserProfile.touch(user_id=request.user.id)
+        return response
+
+    @staticmethod
+    def error(reason, status=400, **kwargs):
+        data = {
+            'success': False,
+            'reason': reason,
+        }
+        data.update(kwargs)
+        return JsonResponse(data, status=status)
+
+    def log_changes(self, ids, action=ChangeLogEntry.UPDATE):
+        # Queryset updates and raw deletes send no signals to log them
+        profile_id = UserProfile.objects.filter(user_id=self.request.user.id).values_list('id', flat=True).first()
+        record_changes(profile_id, MODEL_NAMES[self.model], ids, action)
+
+    def bulk_delete(self, data):
+        ids = set(int(x) for x in data['ids'])
+        deleted = self.get_queryset().filter(pk__in=ids).delete()[1].get(self.model._meta.label, 0)
+        if deleted != len(ids):
+            return self.error('{}_DNE'.format(self.model.__name__.upper()), status=404)
+        return JsonResponse({
+            'success': True,
+            'deleted': deleted,
+        })
+
+    def bulk_update(self, data):
+        changes, errors = {}, {}
+        for change in data['changes']:
+            pk = int(change['id'])
+            form = self.form_class(data={k: as_form_value(v) for k, v in change.items()})
+            if not form.is_valid():
+                errors[pk] = form.errors
+                continue
+            changes[pk] = {k: form.cleaned_data[k] for k in change if k in form.fields and k in form.cleaned_data}
+        if errors:
+            return self.error('INVALID_CHANGES', errors=errors)
+        updated = bulk_update_fields(self.get_queryset(), changes)
+        if updated != len(changes):
+            return self.error('{}_DNE'.format(self.model.__name__.upper()), status=404)
+        self.log_changes(changes)
+        return JsonResponse({
+            'success': True,
+            'updated': updated,
+        })
+
+
+class BulkRoutineView(BulkEditView):
+    model = Routine
+    form_class = RoutineForm
+
+    def bulk_delete(self, data):
+        ids = set(int(x) for x in data['ids'])
+        routines = list(self.get_queryset().filter(pk__in=ids))
+        if len(routines) != len(ids):
+            return self.error('ROUTINE_DNE', status=404)
+        for routine in routines:
+            soft_delete_routine(routine)
+        return JsonResponse({
+            'success': True,
+            'deleted': len(routines),
+        })
+
+
+class BulkExerciseView(BulkEditView):
+    """Also supports {"action": "reorder", "routine_id": 1, "ids": [3, 1, 2]} to set priorities in that order"""
+    model = Exercise
+    form_class = ExerciseForm
+    owner_lookup = 'routine__user__user_id'
+    actions = ('delete', 'update', 'reorder')
+
+    def bulk_delete(self, data):
+        # Skips QuerySet.delete()'s collector, which would load every history row and send a signal for each
+        ids = set(int(x) for x in data['ids'])
+        exercises = self.get_queryset().filter(pk__in=ids)
+        if exercises.count() != len(ids):
+            return self.error('EXERCISE_DNE', status=404)
+        deleted = delete_exercises(exercises.values('id'))
+        self.log_changes(ids, ChangeLogEntry.DELETE)
+        return JsonResponse({
+            'success': True,
+            'deleted': deleted,
+        })
+
+    def bulk_reorder(self, data):
+        ids = [int(x) for x in data['ids']]
+        queryset = self.get_queryset().filter(routine_id=int(data['routine_id']))
+        updated = bulk_update_fields(queryset, {pk: {'priority': index} for index, pk in enumerate(ids)})
+        if updated != len(set(ids)):
+            return self.error('EXERCISE_DNE', status=404)
+        self.log_changes(set(ids))
+        return JsonResponse({
+            'success': True,
+            'updated': updated,
+        })
+
+
 class ExerciseDetailView(TemplateView):
     template_name = 'workout/exercises/exercise-detail.html'
 
 
-class EditExerciseView(AjaxableResponseMixin, UpdateView):
+class EditExerciseView(AjaxableResponseMixin, DirtyFieldsUpdateMixin, UpdateView):
     form_class = ExerciseForm
     model = Exercise
 
     def get_object(self):
-        return Exercise.objects.get(pk=self.request.POST['exercise_id'])
+        return get_object_or_404(live_exercises(), pk=self.request.POST['exercise_id'])
 
 
 class AddExerciseHistoryView(AjaxableResponseMixin, CreateView):
@@ -177,22 +444,173 @@ class AddExerciseHistoryView(AjaxableResponseMixin, CreateView):
     template_name = 'workout/history/add-exercise-history.html'
 
     def form_valid(self, form):
-        form.instance.exercise_id = self.kwargs['exercise_id']
+        form.instance.exercise = get_object_or_404(live_exercises(), pk=self.kwargs['exercise_id'])
         return super(AddExerciseHistoryView, self).form_valid(form)
 
 
-class EditExerciseHistoryView(AjaxableResponseMixin, UpdateView):
+class LogSessionView(LoginRequiredMixin, View):
+    """
+    Logs a whole workout session in one request. Expects a JSON body like
+    {"timestamp": "2017-01-03T18:00:00Z", "exercises": [{"exercise_id": 1, "sets": [8, 8], "weights_per_set": [100, 100]}]}
+    Every entry is validated with ExerciseHistoryForm before anything is written.
+    """
+    login_url = '/login/'
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            entries = data['exercises']
+            timestamp = parse_datetime(data.get('timestamp') or '') or timezone.now()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self.error('INVALID_PAYLOAD')
+        if not isinstance(entries, list):
+            return self.error('INVALID_PAYLOAD')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        exercise_ids = set(Exercise.objects.filter(
+            routine__user__user_id=request.user.id,
+            pk__in=[parse_id(x.get('exercise_id')) for x in entries if isinstance(x, dict)],
+        ).values_list('id', flat=True))
+
+        histories, errors = [], {}
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict) or not isinstance(entry.get('notes', ''), str):
+                errors[index] = {'__all__': ['INVALID_ENTRY']}
+                continue
+            form = ExerciseHistoryForm(data={
+                'sets': as_form_value(entry.get('sets')),
+                'weights_per_set': as_form_value(entry.get('weights_per_set')),
+            })
+            exercise_id = parse_id(entry.get('exercise_id'))
+            if not form.is_valid():
+                errors[index] = form.errors
+            elif exercise_id not in exercise_ids:
+                errors[index] = {'exercise_id': ['EXERCISE_DNE']}
+            else:
+                form.instance.exercise_id = exercise_id
+                form.instance.timestamp = timestamp
+                form.instance.notes = entry.get('notes', '')
+                histories.append(form.instance)
+        if errors:
+            return JsonResponse({
+                'success': False,
+                'errors': errors,
+            }, status=400)
+
+        with transaction.atomic():
+            bulk_create_history(histories)
+        return JsonResponse({
+            'success': True,
+            'ids': [x.pk for x in histories],
+        })
+
+    @staticmethod
+    def error(reason):
+        return JsonResponse({
+            'success': False,
+            'reason': reason,
+        }, status=400)
+
+
+class LogCardioView(LoginRequiredMixin, View):
+    """
+    Uploads a whole cardio session in one request. Expects a JSON body like
+    {"timestamp": "2017-01-03T18:00:00Z", "interval": 1, "heart_rate": [120, 121], "pace": [300.5, 299], "distance": [3.3, 6.7]}
+    Every series is optional, but those sent must have one sample per interval, with null for gaps.
+    """
+    login_url = '/login/'
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            interval = float(data.get('interval', 1))
+            series = {name: data[name] for name in cardio.SERIES if data.get(name)}
+            timestamp = parse_datetime(data.get('timestamp') or '') or timezone.now()
+        except (ValueError, TypeError, AttributeError):
+            return self.error('INVALID_PAYLOAD')
+        # Checked before packing, so an oversized upload is rejected without converting it
+        lengths = set(len(x) if isinstance(x, list) else -1 for x in series.values())
+        if not 0 < interval < float('inf') or len(lengths) != 1 or not 0 < max(lengths) <= cardio.MAX_SAMPLES:
+            return self.error('INVALID_SAMPLES')
+        try:
+            packed = {name: cardio.pack(name, values) for name, values in series.items()}
+        except (ValueError, TypeError, OverflowError):  # Samples that aren't numbers or null
+            return self.error('INVALID_SAMPLES')
+
+        try:
+            exercise = Exercise.objects.get(pk=kwargs['exercise_id'], routine__user__user_id=request.user.id)
+        except exceptions.ObjectDoesNotExist:
+            return self.error('EXERCISE_DNE', status=404)
+        if exercise.exercise_type != 'CARDIO':
+            return self.error('NOT_CARDIO')
+
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        with transaction.atomic():
+            history = exercise.history.create(timestamp=timestamp, sets=[], weights_per_set=[],
+                                              notes=data.get('notes', ''))
+            session = CardioSession.objects.create(history=history, interval=interval,
+                                                   sample_count=lengths.pop(), **packed)
+        return JsonResponse({
+            'success': True,
+            'id': history.id,
+            'summary': session.summary(),
+        })
+
+    @staticmethod
+    def error(reason, status=400):
+        return JsonResponse({
+            'success': False,
+            'reason': reason,
+        }, status=status)
+
+
+class CardioSamplesView(LoginRequiredMixin, View):
+    """
+    Chart data for a cardio session: GET ?points=300&series=heart_rate,pace returns each series
+    downsampled to at most `points` [seconds, value] pairs
+    """
+    login_url = '/login/'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            points = min(max(int(request.GET.get('points', cardio.DEFAULT_POINTS)), 3), cardio.MAX_SAMPLES)
+        except ValueError:
+            points = cardio.DEFAULT_POINTS
+        names = [x for x in request.GET.get('series', ','.join(sorted(cardio.SERIES))).split(',') if x]
+        if any(x not in cardio.SERIES for x in names):
+            return JsonResponse({
+                'success': False,
+                'reason': 'UNKNOWN_SERIES',
+            }, status=400)
+        try:
+            session = CardioSession.objects.only('interval', 'sample_count', *names).get(
+                history_id=kwargs['history_id'], history__exercise__routine__user__user_id=request.user.id)
+        except exceptions.ObjectDoesNotExist:
+            return JsonResponse({
+                'success': False,
+                'reason': 'CARDIO_SESSION_DNE',
+            }, status=404)
+        return JsonResponse({
+            'success': True,
+            'interval': session.interval,
+            'sample_count': session.sample_count,
+            'series': {x: cardio.downsample(x, getattr(session, x), session.interval, points) for x in names},
+        })
+
+
+class EditExerciseHistoryView(AjaxableResponseMixin, DirtyFieldsUpdateMixin, UpdateView):
     form_class = ExerciseHistoryForm
     model = ExerciseHistory
 
     def get_object(self):
-        return ExerciseHistory.objects.get(pk=self.kwargs['history_id'])
+        return get_object_or_404(live_history(), pk=self.kwargs['history_id'])
 
 
 class DeleteExerciseHistoryView(View):
     def post(self, request, *args, **kwargs):
         try:
-            ExerciseHistory.objects.get(pk=kwargs['history_id']).delete()
+            live_history().get(pk=kwargs['history_id']).delete()
             return JsonResponse({
                 'success': True,
             })
@@ -203,48 +621,118 @@ class DeleteExerciseHistoryView(View):
             })
 
 
+@conditional_on_user_data
 class ExerciseHistoryListView(TemplateView):
     template_name = 'workout/history/exercise-history-report-base.html'
 
     def dispatch(self, request, *args, **kwargs):
-        exercise = Exercise.objects.get(pk=kwargs['exercise_id'])
+        exercise = get_object_or_404(live_exercises(), pk=kwargs['exercise_id'])
         if request.is_ajax():
-            history = self.get_history(exercise, request.GET, kwargs)
+            history, next_cursor = self.get_history(exercise, request.GET, kwargs), None
+            # Paginated only when asked for, the report page's script reads the whole range at once
+            if 'cursor' in request.GET or 'page_size' in request.GET:
+                try:
+                    history, next_cursor = paginate_by_keyset(
+                        history, request.GET.get('cursor'), get_page_size(request.GET.get('page_size')))
+                except InvalidCursor:
+                    return JsonResponse({
+                        'success': False,
+                        'reason': 'INVALID_CURSOR',
+                    }, status=400)
             history = [x.json() for x in history]
             return JsonResponse({
                 'success': True,
                 'history': history,
+                'next': next_cursor,
+                'daily_volume': [x.json() for x in self.get_daily_volume(exercise, request.GET)],
             })
         return super(ExerciseHistoryListView, self).dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
-        exercise = Exercise.objects.get(pk=kwargs['exercise_id'])
+        exercise = get_object_or_404(live_exercises(), pk=kwargs['exercise_id'])
         kwargs['history'] = self.get_history(exercise, self.request.GET, kwargs).all()
+        kwargs['daily_volume'] = self.get_daily_volume(exercise, self.request.GET)
         return super(ExerciseHistoryListView, self).get_context_data(**kwargs)
 
     @staticmethod
-    def get_history(exercise, data, kwargs):
-        report_type = data.get('report_type', 'date_range')
-        if report_type == 'date_range':
+    def get_report_days(data):
+        """
+        The inclusive (start, end) calendar days a report covers, in the current timezone.
+        A 'day' report is a range of one day.
+        """
+        if data.get('report_type', 'date_range') == 'date_range':
+            end_date = date_windows.parse_day(data.get('end_date'), date_windows.today())
+            start_date = date_windows.parse_day(data.get('start_date'), end_date - datetime.timedelta(days=7))
+            return start_date, end_date
+        date = date_windows.parse_day(data.get('date'), date_windows.today())
+        return date, date
+
+    @classmethod
+    def get_daily_volume(cls, exercise, data):
+        """Daily totals for the report, read from the rollup table instead of the raw history"""
+        return exercise.get_daily_volume(*cls.get_report_days(data))
+
+    @classmethod
+    def get_history(cls, exercise, data, kwargs):
+        start_date, end_date = cls.get_report_days(data)
+        if data.get('report_type', 'date_range') == 'date_range':
             kwargs['date_range_history'] = True
-            start_date_str = data.get('start_date', (timezone.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d'))
-            end_date_str = data.get('end_date', timezone.now().strftime('%Y-%m-%d'))
-            start_date = datetime.datetime.strptime(start_date_str, '%Y-%m-%d')
-            end_date = datetime.datetime.strptime(end_date_str, '%Y-%m-%d')
             history = exercise.get_history_by_date_range(start_date, end_date)
         else:
             kwargs['date_range_history'] = False
-            date = datetime.datetime.strptime(data.get('date'), '%Y-%m-%d')
-            history = exercise.get_history_by_day(date)
+            history = exercise.get_history_by_day(start_date)
         return history
 
 
+class ExerciseAnalyticsView(LoginRequiredMixin, View):
+    """Vectorized progression statistics (estimated 1RM, tonnage, rolling averages, PRs) for a user's exercise"""
+    login_url = '/login/'
+
+    def get(self, request, *args, **kwargs):
+        formula = request.GET.get('formula', 'epley')
+        try:
+            window = max(int(request.GET.get('window', 5)), 1)
+        except ValueError:
+            window = 5
+        if formula not in analytics.ONE_REP_MAX_FORMULAS:
+            return JsonResponse({
+                'success': False,
+                'reason': 'UNKNOWN_FORMULA',
+            }, status=400)
+        exercise = get_object_or_404(Exercise, pk=kwargs['exercise_id'], routine__user__user_id=request.user.id)
+        return JsonResponse({
+            'success': True,
+            'progression': analytics.progression(exercise, formula, window),
+        })
+
+
+class SyncView(LoginRequiredMixin, View):
+    """
+    Delta sync for offline clients: GET /sync/?since=<next from the last sync> returns the user's routines,
+    exercises and history changed since then, plus the ids of those deleted. Leave out `since` for a full sync.
+    """
+    login_url = '/login/'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET.get('since') or 0)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'reason': 'INVALID_TOKEN',
+            }, status=400)
+        data = changes_since(request.user.id, since)
+        data['success'] = True
+        return JsonResponse(data)
+
+
+@conditional_on_user_data
 class ExerciseHistoryDetailView(TemplateView):
     template_name = 'workout/history/exercise-history-detail.html'
 
     def dispatch(self, request, *args, **kwargs):
         if request.is_ajax():
-            history = ExerciseHistory.objects.get(pk=kwargs['history_id'])
+            history = get_object_or_404(live_history(), pk=kwargs['history_id'])
             return JsonResponse({
                 'success': True,
                 'history': history.json(),
@@ -252,5 +740,86 @@ class ExerciseHistoryDetailView(TemplateView):
         return super(ExerciseHistoryDetailView, self).dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
-        kwargs['history'] = ExerciseHistory.objects.get(pk=kwargs['history_id'])
+        kwargs['history'] = get_object_or_404(live_history(), pk=kwargs['history_id'])
         return super(ExerciseHistoryDetailView, self).get_context_data(**kwargs)
+
+
+class ProfilingStatsView(LoginRequiredMixin, View):
+    """Staff only. Per URL name percentiles from ProfilingMiddleware for this process"""
+    login_url = '/login/'
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise exceptions.PermissionDenied
+        return JsonResponse({
+            'success': True,
+            'profiles': profiling.store.summary(),
+        })
+
+    def delete(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise exceptions.PermissionDenied
+        profiling.store.clear()
+        return JsonResponse({
+            'success': True,
+        })
+
+
+class Echo(object):
+    """File-like object that hands back what csv.writer writes so rows can be streamed"""
+    def write(self, value):
+        return value
+
+
+class ExportHistoryView(LoginRequiredMixin, View):
+    """
+    Streams every ExerciseHistory row for the logged in user as CSV or NDJSON.
+    Rows are fetched in keyset-ordered chunks so memory stays flat however long the history is.
+    """
+    login_url = '/login/'
+    chunk_size = 2000
+    fields = ('id', 'exercise_id', 'exercise__name', 'timestamp', 'sets', 'weights_per_set', 'notes')
+    headers = ('id', 'exercise_id', 'exercise', 'timestamp', 'sets', 'weights_per_set', 'notes')
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format == 'ndjson':
+            response = StreamingHttpResponse(self.ndjson_rows(), content_type='application/x-ndjson')
+        elif export_format == 'csv':
+            response = StreamingHttpResponse(self.csv_rows(), content_type='text/csv')
+        else:
+            return JsonResponse({
+                'success': False,
+                'reason': 'UNKNOWN_FORMAT',
+            }, status=400)
+        response['Content-Disposition'] = 'attachment; filename="history.{}"'.format(export_format)
+        return response
+
+    def get_rows(self):
+        queryset = ExerciseHistory.objects.filter(
+            exercise__routine__user__user=self.request.user
+        ).order_by('id').values_list(*self.fields)
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:self.chunk_size].iterator())
+            for row in chunk:
+                yield row
+            if len(chunk) < self.chunk_size:
+                return
+            last_id = chunk[-1][0]
+
+    def csv_rows(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.headers)
+        for row in self.get_rows():
+            row = list(row)
+            row[3] = row[3].isoformat()
+            row[4] = ','.join(map(str, row[4]))
+            row[5] = ','.join(map(str, row[5]))
+            yield writer.writerow(row)
+
+    def ndjson_rows(self):
+        for row in self.get_rows():
+            data = dict(zip(self.headers, row))
+            data['timestamp'] = data['timestamp'].isoformat()
+            yield json.dumps(data) + '\n'